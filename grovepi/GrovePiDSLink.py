@@ -1,7 +1,21 @@
 from collections import OrderedDict
+import json
+import os
+import threading
+import time
 from dslink import DSLink, Configuration, Node, Value
 import dsa_grovepi as grovepi
 import grove_rgb_led
+from i2c_bus import bus, ACTUATOR, SENSOR
+from motion import MotionSummary, to_g
+from acquisition import AcquisitionProcess, read_module
+from pi_gpio import EdgeInputs, reset_board
+from profiler import LinkProfiler
+from rules import CONDITIONS, Rule, parse_output_value
+from subscriptions import LinkSubscriptionManager
+from watchdog import BoardWatchdog
+from clock import monotonic
+from datetime import datetime
 from math import isnan
 from twisted.internet import reactor
 
@@ -28,6 +42,15 @@ class GrovePiDSLink(DSLink):
         ("I2C-1", ["i2c", 1]),
         ("I2C-2", ["i2c", 2]),
         ("I2C-3", ["i2c", 3]),
+        ("GPIO5", ["gpio", 5]),
+        ("GPIO6", ["gpio", 6]),
+        ("GPIO12", ["gpio", 12]),
+        ("GPIO13", ["gpio", 13]),
+        ("GPIO16", ["gpio", 16]),
+        ("GPIO19", ["gpio", 19]),
+        ("GPIO20", ["gpio", 20]),
+        ("GPIO21", ["gpio", 21]),
+        ("GPIO26", ["gpio", 26]),
     ])
 
     modules = [
@@ -40,23 +63,147 @@ class GrovePiDSLink(DSLink):
         "Sound Sensor",
         "Button",
         "Relay",
-        "Temp and Humid"
+        "Temp and Humid",
+        "Encoder",
+        "Flow Meter",
+        "Dust Sensor",
+        "LED Bar",
+        "4-Digit Display",
+        "Chainable RGB LED",
+        "Accelerometer",
+        "RTC"
     ]
 
+    # Firmware counters are fixed to these ports.
+    counter_addresses = {
+        "Encoder": "D2",
+        "Flow Meter": "D2",
+        "Dust Sensor": "D8"
+    }
+
+    # Seconds between reads of the firmware counters, and between Encoder rate updates.
+    counter_interval = 1.0
+
+    # Steps per revolution of the Grove encoder, the firmware position wraps at this.
+    encoder_steps = 24
+
+    # Length of the firmware dust sensor sampling window in milliseconds.
+    dust_window = 30000
+
+    # Output modules that can play a timed sequence of values.
+    sequence_modules = ["LED", "Buzzer", "Relay"]
+
+    # Modules slow enough to read that they are worth sampling in the background.
+    slow_modules = ["Temp and Humid"]
+
+    # Modules with text values. The sample ring only holds numbers, so these
+    # are read by the cycle rather than by the acquisition process.
+    text_modules = ["RTC"]
+
+    # Seconds the accelerometer high rate worker waits after a failed read.
+    motion_retry = 0.5
+
+    # Seconds of capture samples sent in one update to Capture Data.
+    capture_chunk = 0.25
+
+    # AcquisitionProcess when polling runs in a separate process, see acquisition.py.
+    acquisition = None
+
     def __init__(self, config):
         self.do_restore = True
+        self.pending_updates = []
+        self.batch_started = None
+        self.batch_call = None
+        self.messages_sent = 0
+        self.messages_saved = 0
+        self.next_tick = None
+        self.overruns = 0
+        self.counters = {}
+        self.bus_busy_until = None
+        self.profiler = LinkProfiler()
+        if self.acquisition is None:
+            # LCD writes run on the writer thread, profile them with the rest.
+            grove_rgb_led.writer.wrap = self.profiler.wrap
+        self.rules = {}
+        self.rule_checks = {}
+        self.sequences = {}
+        self.captures = set()
+        self.motion = {}
+        self.edge_inputs = EdgeInputs()
+        self.watchdog = BoardWatchdog(bus, self.probe_board,
+                                      lambda: reset_board(self.edge_inputs.get_gpio()),
+                                      self.board_recovered)
+        self.recoveries = 0
+        self.loaded = {}
+        self.refresh_due = OrderedDict()
+        self.refresh_call = None
         DSLink.__init__(self, config)
 
     def start(self):
+        self.loaded = self.load_times(self.super_root)
+
         self.profile_manager.create_profile("add_module")
         self.profile_manager.register_callback("add_module", self.add_module)
 
+        self.profile_manager.create_profile("add_modules")
+        self.profile_manager.register_callback("add_modules", self.add_modules)
+
+        self.profile_manager.create_profile("capture")
+        self.profile_manager.register_callback("capture", self.capture)
+
+        self.profile_manager.create_profile("four_digit_monitor")
+        self.profile_manager.register_callback("four_digit_monitor", self.four_digit_monitor)
+
+        self.profile_manager.create_profile("play_sequence")
+        self.profile_manager.register_callback("play_sequence", self.play_sequence)
+
+        self.profile_manager.create_profile("profile")
+        self.profile_manager.register_callback("profile", self.profile)
+
+        self.profile_manager.create_profile("profile_results")
+        self.profile_manager.register_callback("profile_results", self.profile_results)
+
+        self.profile_manager.create_profile("read_all")
+        self.profile_manager.register_callback("read_all", self.read_all)
+
         self.profile_manager.create_profile("remove_module")
         self.profile_manager.register_callback("remove_module", self.remove_module)
 
+        self.profile_manager.create_profile("add_rule")
+        self.profile_manager.register_callback("add_rule", self.add_rule)
+
+        self.profile_manager.create_profile("remove_rule")
+        self.profile_manager.register_callback("remove_rule", self.remove_rule)
+
+        self.profile_manager.create_profile("stop_sequence")
+        self.profile_manager.register_callback("stop_sequence", self.stop_sequence)
+
         if self.restore:
             self.restore(self.super_root)
 
+        if not self.super_root.has_child("add_modules"):
+            self.super_root.add_child(self.add_modules_node(self.super_root))
+        if not self.super_root.has_child("batch_delay"):
+            self.super_root.add_child(self.batch_delay_node(self.super_root))
+        if not self.super_root.has_child("cache_max_age"):
+            self.super_root.add_child(self.cache_max_age_node(self.super_root))
+            self.super_root.add_child(self.background_interval_node(self.super_root))
+        if not self.super_root.has_child("poll_mode"):
+            self.super_root.add_child(self.poll_mode_node(self.super_root))
+        if not self.super_root.has_child("profile"):
+            self.super_root.add_child(self.profile_node(self.super_root))
+            self.super_root.add_child(self.profile_results_node(self.super_root))
+        if not self.super_root.has_child("read_all"):
+            self.super_root.add_child(self.read_all_node(self.super_root))
+        if not self.super_root.has_child("rules"):
+            self.super_root.add_child(self.rules_node(self.super_root))
+        self.load_rules()
+        for child in self.super_root.children.values():
+            if "@module" in child.attributes:
+                self.add_module_actions(child)
+        self.super_root.add_child(self.metrics_node(self.super_root))
+        self.subman = LinkSubscriptionManager(self, self.subman.subscriptions)
+
         reactor.callLater(0.1, self.update_values)
 
     def restore(self, node):
@@ -71,13 +218,37 @@ class GrovePiDSLink(DSLink):
                     child.set_value_callback = self.set_text
                 elif child.attributes["@callback"] == "rgb_color":
                     child.set_value_callback = self.set_color
+                elif child.attributes["@callback"] == "display":
+                    child.set_value_callback = self.set_display
+                elif child.attributes["@callback"] == "high_rate":
+                    child.set_value_callback = self.set_high_rate
             if "@mode" in child.attributes and "@address":
                 mode = child.attributes["@mode"]
                 address = self.addresses[child.attributes["@address"]][1]
                 if mode == "output":
                     grovepi.pinMode(address, "OUTPUT")
                 elif mode == "input":
-                    grovepi.pinMode(address, "INPUT")
+                    if child.attributes["@type"] != "i2c":
+                        grovepi.pinMode(address, "INPUT")
+                else:
+                    self.init_module(child)
+
+    def load_times(self, node, times=None):
+        """
+        Collect the timestamps the SDK gave the values it loaded. It stamps
+        restored values with the time they were loaded, which says nothing
+        of when they were acquired.
+        :param node: Node to start from.
+        :param times: Dict to add to.
+        :return: Dict of path to timestamp.
+        """
+        if times is None:
+            times = {}
+        if node.value.updated_at is not None:
+            times[node.path] = node.value.updated_at
+        for child in node.children.values():
+            self.load_times(child, times)
+        return times
 
     def get_default_nodes(self):
         self.do_restore = False
@@ -115,39 +286,148 @@ class GrovePiDSLink(DSLink):
         poll_speed.set_config("$writable", "config")
 
         super_root.add_child(add_module)
+        super_root.add_child(self.add_modules_node(super_root))
         super_root.add_child(poll_speed)
+        super_root.add_child(self.poll_mode_node(super_root))
+        super_root.add_child(self.batch_delay_node(super_root))
+        super_root.add_child(self.cache_max_age_node(super_root))
+        super_root.add_child(self.background_interval_node(super_root))
+        super_root.add_child(self.profile_node(super_root))
+        super_root.add_child(self.profile_results_node(super_root))
+        super_root.add_child(self.read_all_node(super_root))
+        super_root.add_child(self.rules_node(super_root))
 
         return super_root
 
     def set_value(self, node, value):
-        if type(value) == bool:
-            grovepi.digitalWrite(self.addresses[node.attributes["@address"]][1], value)
-        elif type(value) == int:
-            if node.attributes["@type"] == "pwm":
-                node.set_value(value)
-                grovepi.analogWrite(self.addresses[node.attributes["@address"]][1], self.percent_to_pwm(value))
-            else:
-                node.set_value(value)
-                grovepi.analogWrite(self.addresses[node.attributes["@address"]][1], self.percent_to_analog(value))
+        with bus.claim(ACTUATOR):
+            if type(value) == bool:
+                grovepi.digitalWrite(self.addresses[node.attributes["@address"]][1], value)
+            elif type(value) == int:
+                if node.attributes["@type"] == "pwm":
+                    node.set_value(value)
+                    grovepi.analogWrite(self.addresses[node.attributes["@address"]][1], self.percent_to_pwm(value))
+                else:
+                    node.set_value(value)
+                    grovepi.analogWrite(self.addresses[node.attributes["@address"]][1], self.percent_to_analog(value))
 
     def set_color(self, node, value):
         red, green, blue = rgb(hex(int(value))[2:].zfill(6))
-        grove_rgb_led.set_rgb(red, green, blue)
+        grove_rgb_led.show_rgb(red, green, blue)
         return []
 
     def set_text(self, node, value):
         text = str(value)
-        grove_rgb_led.set_text(text)
+        # The LCD claims the bus a row at a time from its writer thread, so
+        # polling carries on while the text is written.
+        grove_rgb_led.show_text(text)
         return []
 
     def add_module(self, parameters):
         if "Name" not in parameters.params:
             return [["Invalid name."]]
-        node = Node(str(parameters.params["Name"]), self.super_root)
+        node, pin_mode, error = self.create_module(str(parameters.params["Name"]),
+                                                   parameters.params["Type"],
+                                                   parameters.params["Address"])
+        if error is not None:
+            return [[error]]
+        with bus.claim(ACTUATOR):
+            if pin_mode is not None:
+                grovepi.pinMode(self.addresses[node.attributes["@address"]][1], pin_mode)
+            self.init_module(node)
+
+        self.super_root.add_child(node)
+
+        return [
+            [
+                "Success!"
+            ]
+        ]
+
+    def add_modules(self, parameters):
+        if "Modules" not in parameters.params:
+            return [["", "No modules given."]]
+        try:
+            rows = self.parse_module_rows(parameters.params["Modules"])
+        except ValueError as e:
+            return [["", str(e)]]
+
+        # Validate every row before touching the node tree or the bus.
+        results = []
+        nodes = []
+        names = set()
+        for name, module_type, address in rows:
+            if name in names:
+                node, pin_mode, error = None, None, "Duplicate name"
+            else:
+                node, pin_mode, error = self.create_module(name, module_type, address,
+                                                           [pending[0] for pending in nodes])
+            names.add(name)
+            results.append([name, error])
+            if error is None:
+                nodes.append((node, pin_mode))
+
+        if len(nodes) != len(rows):
+            return [[name, error if error is not None else "Skipped"] for name, error in results]
+
+        # Apply in a single pass, one pinMode write per pin.
+        pin_modes = OrderedDict()
+        for node, pin_mode in nodes:
+            self.super_root.add_child(node)
+            if pin_mode is not None:
+                pin_modes[self.addresses[node.attributes["@address"]][1]] = pin_mode
+        with bus.claim(ACTUATOR):
+            for pin in pin_modes:
+                grovepi.pinMode(pin, pin_modes[pin])
+            for node, pin_mode in nodes:
+                self.init_module(node)
+
+        return [[name, "Success!"] for name, error in results]
+
+    @staticmethod
+    def parse_module_rows(modules):
+        """
+        Parse module rows from a JSON list or from comma separated lines.
+        :param modules: JSON list of objects or lists, or "name,type,address" lines.
+        :return: List of (name, type, address) tuples.
+        """
+        if isinstance(modules, (str, type(u""))):
+            try:
+                modules = json.loads(modules)
+            except ValueError:
+                modules = [line.split(",") for line in modules.splitlines() if line.strip()]
+        if not isinstance(modules, list):
+            raise ValueError("Modules must be a list")
+        rows = []
+        for row in modules:
+            if isinstance(row, dict):
+                row = [row.get("Name"), row.get("Type"), row.get("Address")]
+            if not isinstance(row, list) or len(row) != 3 or None in row:
+                raise ValueError("Invalid row %s" % json.dumps(row))
+            rows.append(tuple(str(i).strip() for i in row))
+        return rows
+
+    def create_module(self, name, module_type, address, pending=None):
+        """
+        Build a module Node without adding it to the tree or writing to the bus.
+        :param name: Module name.
+        :param module_type: One of modules.
+        :param address: One of addresses.
+        :param pending: Module Nodes of the same batch, not in the tree yet.
+        :return: Node, pin mode to apply (or None) and error message (or None).
+        """
+        if not name:
+            return None, None, "Invalid name."
+        if self.super_root.has_child(name):
+            return None, None, "Name already in use"
+        if module_type not in self.modules:
+            return None, None, "Unknown module type"
+        if address not in self.addresses:
+            return None, None, "Unknown address"
+        node = Node(name, self.super_root)
         node.set_attribute("@callback", "module")
-        module_type = parameters.params["Type"]
-        address = parameters.params["Address"]
         address_type = self.addresses[address][0]
+        pin_mode = None
         node.set_attribute("@module", module_type)
         node.set_attribute("@address", address)
         node.set_attribute("@type", address_type)
@@ -155,16 +435,16 @@ class GrovePiDSLink(DSLink):
         node.set_config("$writable", "write")
         if module_type == "LED":
             if address_type == "pwm":
-                grovepi.pinMode(self.addresses[address][1], "OUTPUT")
+                pin_mode = "OUTPUT"
                 node.set_type("number")
                 node.set_attribute("@mode", "output")
                 node.set_attribute("@unit", "%")
             elif address_type == "digital":
-                grovepi.pinMode(self.addresses[address][1], "OUTPUT")
+                pin_mode = "OUTPUT"
                 node.set_type("bool")
                 node.set_attribute("@mode", "output")
             else:
-                return [["Requires pwm or digital"]]
+                return None, None, "Requires pwm or digital"
         elif module_type == "RGB LCD":
             node.add_child(self.color_node(node))
             node.add_child(self.text_node(node))
@@ -174,75 +454,664 @@ class GrovePiDSLink(DSLink):
                 node.set_attribute("@unit", "%")
                 node.set_attribute("@mode", "input")
             else:
-                return [["Requires analog"]]
+                return None, None, "Requires analog"
         elif module_type == "Rotary Angle Sensor":
             if address_type == "analog":
-                grovepi.pinMode(self.addresses[address][1], "INPUT")
+                pin_mode = "INPUT"
                 node.set_type("number")
                 node.set_attribute("@unit", "%")
                 node.set_attribute("@mode", "input")
             else:
-                return [["Requires analog"]]
+                return None, None, "Requires analog"
         elif module_type == "Ultrasonic Ranger":
             if address_type == "digital" or address_type == "pwm":
-                grovepi.pinMode(self.addresses[address][1], "INPUT")
+                pin_mode = "INPUT"
                 node.set_type("number")
                 node.set_attribute("@unit", "cm")
                 node.set_attribute("@mode", "input")
             else:
-                return [["Requires digital or pwm"]]
+                return None, None, "Requires digital or pwm"
         elif module_type == "Buzzer":
             if address_type == "digital" or address_type == "pwm":
-                grovepi.pinMode(self.addresses[address][1], "OUTPUT")
+                pin_mode = "OUTPUT"
                 node.set_type("number")
                 node.set_attribute("@mode", "output")
             else:
-                return [["Requires digital or pwm"]]
+                return None, None, "Requires digital or pwm"
         elif module_type == "Sound Sensor":
             if address_type == "analog":
-                grovepi.pinMode(self.addresses[address][1], "INPUT")
+                pin_mode = "INPUT"
                 node.set_type("number")
                 node.set_attribute("@unit", "%")
                 node.set_attribute("@mode", "input")
             else:
-                return [["Requires analog"]]
+                return None, None, "Requires analog"
         elif module_type == "Button":
             if address_type == "digital" or address_type == "pwm":
-                grovepi.pinMode(self.addresses[address][1], "INPUT")
+                pin_mode = "INPUT"
                 node.set_type("bool")
                 node.set_attribute("@mode", "input")
+            elif address_type == "gpio":
+                node.set_type("bool")
+                node.set_attribute("@mode", "edge")
             else:
-                return [["Requires digital or pwm"]]
+                return None, None, "Requires digital, pwm or gpio"
         elif module_type == "Relay":
             if address_type == "digital" or address_type == "pwm":
-                grovepi.pinMode(self.addresses[address][1], "OUTPUT")
+                pin_mode = "OUTPUT"
                 node.set_type("bool")
                 node.set_attribute("@mode", "output")
             else:
-                return [["Requires digital or pwm"]]
+                return None, None, "Requires digital or pwm"
         elif module_type == "Temp and Humid":
             if address_type == "digital" or address_type == "pwm":
-                grovepi.pinMode(self.addresses[address][1], "INPUT")
+                pin_mode = "INPUT"
                 node.add_child(self.temp_node(node))
                 node.add_child(self.humid_node(node))
                 node.set_attribute("@mode", "input")
             else:
-                return [["Requires digital or pwm"]]
+                return None, None, "Requires digital or pwm"
+        elif module_type in self.counter_addresses:
+            if address != self.counter_addresses[module_type]:
+                return None, None, "Requires %s" % self.counter_addresses[module_type]
+            # Encoder and Flow Meter share the firmware's D2 interrupt.
+            for other in self.module_nodes(pending):
+                if other.attributes.get("@mode") == "counter" and other.attributes["@address"] == address:
+                    return None, None, "%s already uses the %s counter" % (other.name, address)
+            node.set_attribute("@mode", "counter")
+            if module_type == "Encoder":
+                node.add_child(self.reading_node(node, "position", "Position"))
+                node.add_child(self.reading_node(node, "rate", "Rate", "pulses/s"))
+            elif module_type == "Flow Meter":
+                node.add_child(self.reading_node(node, "rate", "Flow Rate", "L/min"))
+                node.add_child(self.reading_node(node, "total", "Total", "L"))
+            elif module_type == "Dust Sensor":
+                node.add_child(self.reading_node(node, "occupancy", "Low Pulse Occupancy", "%"))
+                node.add_child(self.reading_node(node, "concentration", "Concentration", "pcs/0.01cf"))
+        elif module_type in ["LED Bar", "4-Digit Display", "Chainable RGB LED"]:
+            if address_type == "digital" or address_type == "pwm":
+                node.set_attribute("@callback", "display")
+                node.set_attribute("@mode", "display")
+                node.set_value_callback = self.set_display
+                if module_type == "LED Bar":
+                    node.set_type("number")
+                    node.add_child(self.display_node(node, "bits", "Bits", "number"))
+                elif module_type == "4-Digit Display":
+                    node.set_type("number")
+                    node.add_child(self.display_node(node, "brightness", "Brightness", "number"))
+                    node.add_child(self.four_digit_monitor_node(node))
+                else:
+                    del node.config["$writable"]
+                    node.add_child(self.display_node(node, "leds", "LED Count", "number", 1))
+                    node.add_child(self.display_node(node, "color", "Color", "dynamic", editor="color"))
+                    node.add_child(self.display_node(node, "level", "Level", "number"))
+            else:
+                return None, None, "Requires digital or pwm"
+        elif module_type in ["Accelerometer", "RTC"]:
+            if address_type != "i2c":
+                return None, None, "Requires i2c"
+            # Both answer through the GrovePi firmware at a fixed address.
+            for other in self.module_nodes(pending):
+                if other.attributes.get("@module") == module_type:
+                    return None, None, "Only one %s is supported" % module_type
+            del node.config["$writable"]
+            node.set_attribute("@mode", "input")
+            if module_type == "Accelerometer":
+                node.add_child(self.reading_node(node, "x", "X", "g"))
+                node.add_child(self.reading_node(node, "y", "Y", "g"))
+                node.add_child(self.reading_node(node, "z", "Z", "g"))
+                node.add_child(self.high_rate_node(node))
+                node.add_child(self.reading_node(node, "motion", "Motion", "g"))
+                node.add_child(self.reading_node(node, "peak", "Peak", "g"))
+            else:
+                node.set_type("string")
 
+        self.add_module_actions(node)
         node.add_child(self.remove_module_node(node))
 
-        self.super_root.add_child(node)
-
-        return [
-            [
-                "Success!"
-            ]
-        ]
+        return node, pin_mode, None
 
     def remove_module(self, parameters):
-        self.super_root.remove_child(parameters.node.parent.name)
+        node = parameters.node.parent
+        if node.attributes.get("@mode") == "counter":
+            with bus.claim(ACTUATOR):
+                self.enable_counter(node.attributes["@module"], False)
+            self.counters.pop(node.path, None)
+        elif node.attributes.get("@mode") == "edge":
+            self.edge_inputs.remove(self.addresses[node.attributes["@address"]][1])
+        self.cancel_sequence(node)
+        self.captures.discard(node.path)
+        self.motion.pop(node.path, None)
+        self.remove_node(self.super_root, node.name)
         return []
 
+    def add_module_actions(self, node):
+        """
+        Add the actions and nodes that come with a module type, where the
+        module does not have them yet because it was created before them.
+        :param node: Module Node.
+        """
+        if node.attributes["@module"] in self.sequence_modules and not node.has_child("play_sequence"):
+            node.add_child(self.play_sequence_node(node))
+            node.add_child(self.stop_sequence_node(node))
+        if node.attributes.get("@type") == "analog" and node.attributes.get("@mode") == "input":
+            if not node.has_child("capture"):
+                node.add_child(self.capture_node(node))
+                node.add_child(self.reading_node(node, "capture_rate", "Capture Rate", "Hz"))
+            if not node.has_child("capture_data"):
+                node.add_child(self.capture_data_node(node))
+
+    def module_nodes(self, pending=None):
+        """
+        :param pending: Module Nodes about to be added, if any.
+        :return: Module Nodes in the tree, followed by the pending ones.
+        """
+        nodes = [child for child in self.super_root.children.values() if "@module" in child.attributes]
+        return nodes + list(pending or [])
+
+    @staticmethod
+    def remove_node(parent, name):
+        """
+        Remove a child Node. The SDK holds on to removed Nodes until it
+        sends the parent's next list update, which never happens while
+        nothing is listing the parent, so drop them in that case.
+        :param parent: Parent Node.
+        :param name: Name of the child to remove.
+        """
+        parent.remove_child(name)
+        if not parent.streams:
+            del parent.removed_children[:]
+
+    def init_module(self, node):
+        """
+        Send the firmware setup a module needs after it is added or restored.
+        :param node: Module Node.
+        """
+        mode = node.attributes.get("@mode")
+        if mode == "counter":
+            self.enable_counter(node.attributes["@module"], True)
+        elif mode == "edge":
+            pin = self.addresses[node.attributes["@address"]][1]
+            value = self.edge_inputs.add(pin, lambda value, ts: self.on_edge(node, value, ts))
+            self.publish(node, value)
+        elif mode == "motion":
+            self.start_motion(node)
+        elif mode == "display":
+            pin = self.addresses[node.attributes["@address"]][1]
+            module = node.attributes["@module"]
+            if module == "LED Bar":
+                grovepi.ledBar_init(pin, 0)
+            elif module == "4-Digit Display":
+                grovepi.fourDigit_init(pin)
+            elif module == "Chainable RGB LED":
+                grovepi.chainableRgbLed_init(pin, int(node.get("/leds").get_value() or 1))
+
+    def on_edge(self, node, value, ts):
+        """
+        Publish an edge reported by a Pi header input.
+        :param node: Module Node.
+        :param value: Pin level after the edge.
+        :param ts: Time of the edge.
+        """
+        self.publish(node, value, ts)
+        self.evaluate_rules(node, value)
+        # Edges come between cycles, send them straight away.
+        self.flush_updates()
+
+    def set_display(self, node, value):
+        """
+        Write to a firmware driven display, using one command per write
+        wherever the firmware offers one.
+        :param node: Display module Node or one of its children.
+        :param value: Value written.
+        """
+        module = node if "@module" in node.attributes else node.parent
+        module_type = module.attributes["@module"]
+        pin = self.addresses[module.attributes["@address"]][1]
+        with bus.claim(ACTUATOR):
+            if module_type == "LED Bar":
+                if node is module:
+                    grovepi.ledBar_setLevel(pin, self.clamp(value, 0, 10))
+                elif node.name == "bits":
+                    grovepi.ledBar_setBits(pin, self.clamp(value, 0, 0x3ff))
+            elif module_type == "4-Digit Display":
+                if node is module:
+                    grovepi.fourDigit_number(pin, self.clamp(value, 0, 0xffff), False)
+                elif node.name == "brightness":
+                    grovepi.fourDigit_brightness(pin, self.clamp(value, 0, 7))
+            elif module_type == "Chainable RGB LED":
+                leds = int(module.get("/leds").get_value() or 1)
+                if node.name == "leds":
+                    grovepi.chainableRgbLed_init(pin, self.clamp(value, 1, 255))
+                elif node.name == "color":
+                    red, green, blue = rgb(hex(int(value))[2:].zfill(6))
+                    grovepi.storeColor(red, green, blue)
+                    grovepi.chainableRgbLed_modulo(pin, 0, 1)
+                elif node.name == "level":
+                    grovepi.chainableRgbLed_setLevel(pin, self.clamp(value, 0, leds), 0)
+        return []
+
+    def four_digit_monitor(self, parameters):
+        module = parameters.node.parent
+        pin = self.addresses[module.attributes["@address"]][1]
+        analog = parameters.params.get("Analog")
+        if analog not in self.addresses or self.addresses[analog][0] != "analog":
+            return [["Requires analog"]]
+        duration = self.clamp(parameters.params.get("Duration", 10), 1, 255)
+        # The firmware samples and displays on its own, and does not answer
+        # the bus until it is done, so hold off polling until then. The
+        # acquisition process gets an empty scan, the next cycle after the
+        # hold hands it the scan list again.
+        if self.acquisition is not None:
+            self.acquisition.set_scan([], self.super_root.get("/poll_speed").get_value() or 0.1)
+        with bus.claim(ACTUATOR):
+            grovepi.fourDigit_monitor_start(pin, self.addresses[analog][1], duration)
+        self.bus_busy_until = monotonic() + duration + 0.05
+        return [["Success!"]]
+
+    def read_all(self, parameters):
+        max_age = parameters.params.get("Max Age")
+        now = datetime.now()
+
+        def age(node):
+            ts = self.acquired_at(node)
+            if ts is None:
+                return None
+            return (now - ts).total_seconds()
+
+        polled = set()
+        for child in self.super_root.children.values():
+            job = self.input_job(child)
+            if job is None:
+                continue
+            nodes, module, port_type, address = job
+            polled.update(node.path for node in nodes)
+            if max_age is None or all(age(node) is not None and age(node) <= max_age for node in nodes):
+                continue
+            # Only entries older than Max Age are read again.
+            try:
+                ts = datetime.now()
+                values = self.read_input(module, port_type, address)
+            except IOError:
+                continue
+            for node, value in zip(nodes, values):
+                self.publish(node, value, ts)
+                self.evaluate_rules(node, value)
+
+        rows = []
+        for child in self.super_root.children.values():
+            if "@module" not in child.attributes:
+                continue
+            nodes = [child] + [node for node in child.children.values()
+                                if "$invokable" not in node.config and not node.transient]
+            for node in nodes:
+                if "$type" not in node.config:
+                    continue
+                node_age = age(node)
+                if not node.value.has_value():
+                    quality = "No Data"
+                elif node_age is None:
+                    # Restored at start and not read since.
+                    quality = "Stale"
+                elif node.path in polled and max_age is not None and node_age > max_age:
+                    quality = "Stale"
+                else:
+                    quality = "Good"
+                rows.append([
+                    node.path,
+                    node.get_value(),
+                    node.attributes.get("@unit"),
+                    node.value.updated_at.isoformat() if node_age is not None else None,
+                    quality
+                ])
+        self.flush_updates()
+        return rows
+
+    def profile(self, parameters):
+        if self.profiler.active:
+            return [["Already profiling"]]
+        duration = parameters.params.get("Duration", 10)
+        if duration <= 0:
+            return [["Invalid duration"]]
+        # Invokes answer straight away, so the run finishes in the
+        # background and Profile Results returns its table.
+        self.profiler.start()
+        reactor.callLater(duration, self.profiler.stop, parameters.params.get("Dump File"))
+        return [["Profiling for %s seconds" % duration]]
+
+    def profile_results(self, parameters):
+        if self.profiler.active:
+            return []
+        return self.profiler.top(int(parameters.params.get("Top", 20)),
+                                 "self" if parameters.params.get("Sort") == "Self Time" else "cumulative")
+
+    def add_rule(self, parameters):
+        params = parameters.params
+        rules = self.super_root.get("/rules")
+        name = str(params.get("Name", ""))
+        if not name or "/" in name:
+            return [["Invalid name."]]
+        if rules.has_child(name):
+            return [["Name already in use"]]
+        input_path = "/" + str(params.get("Input", "")).strip("/")
+        input_node = self.super_root.get(input_path)
+        if input_node is None or "$type" not in input_node.config or input_path.startswith("/rules/"):
+            return [["Unknown input"]]
+        output_path = "/" + str(params.get("Output", "")).strip("/")
+        output_node = self.super_root.get(output_path)
+        if output_node is None or output_node.attributes.get("@mode") != "output":
+            return [["Unknown output"]]
+        condition = params.get("Condition")
+        if condition not in CONDITIONS:
+            return [["Unknown condition"]]
+        try:
+            on_value = parse_output_value(output_node.get_type(), params.get("On Value", ""))
+            off_value = parse_output_value(output_node.get_type(), params.get("Off Value", ""))
+        except ValueError:
+            return [["Invalid output value"]]
+        limits = []
+        for param in ("Threshold", "Hysteresis", "Debounce"):
+            try:
+                limit = float(params.get(param, 0))
+            except (TypeError, ValueError):
+                limit = None
+            if limit is None or isnan(limit) or (param != "Threshold" and limit < 0):
+                return [["Invalid %s" % param.lower()]]
+            limits.append(limit)
+        threshold, hysteresis, debounce = limits
+
+        node = Node(name, rules)
+        node.set_display_name(name)
+        node.set_type("bool")
+        node.set_attribute("@input", input_path)
+        node.set_attribute("@condition", condition)
+        node.set_attribute("@threshold", threshold)
+        node.set_attribute("@hysteresis", hysteresis)
+        node.set_attribute("@debounce", debounce)
+        node.set_attribute("@output", output_path)
+        node.set_attribute("@on_value", on_value)
+        node.set_attribute("@off_value", off_value)
+        node.add_child(self.remove_rule_node(node))
+        rules.add_child(node)
+        self.load_rule(node)
+        return [["Success!"]]
+
+    def remove_rule(self, parameters):
+        node = parameters.node.parent
+        self.unload_rule(node)
+        self.remove_node(self.super_root.get("/rules"), node.name)
+        return []
+
+    def load_rules(self):
+        """
+        Build the rules, indexed by input path, from the Nodes under /rules.
+        """
+        self.rules = {}
+        for node in self.super_root.get("/rules").children.values():
+            if "@input" in node.attributes:
+                self.load_rule(node)
+
+    def load_rule(self, node):
+        """
+        Build the rule of one Node under /rules, starting inactive. The
+        other rules keep their state.
+        :param node: Rule Node.
+        """
+        rule = Rule(node,
+                    node.attributes["@input"],
+                    node.attributes["@condition"],
+                    float(node.attributes["@threshold"]),
+                    float(node.attributes["@hysteresis"]),
+                    float(node.attributes["@debounce"]) / 1000.0,
+                    node.attributes["@output"],
+                    node.attributes["@on_value"],
+                    node.attributes["@off_value"])
+        node.set_value(False)
+        self.rules.setdefault(rule.input_path, []).append(rule)
+
+    def unload_rule(self, node):
+        """
+        Drop the rule of one Node under /rules.
+        :param node: Rule Node.
+        """
+        check = self.rule_checks.pop(node.path, None)
+        if check is not None and check.active():
+            check.cancel()
+        input_path = node.attributes["@input"]
+        rules = [rule for rule in self.rules.get(input_path, []) if rule.node is not node]
+        if rules:
+            self.rules[input_path] = rules
+        else:
+            self.rules.pop(input_path, None)
+
+    def evaluate_rules(self, node, value):
+        """
+        Run the rules on a fresh sample and drive their outputs straight
+        from the link, without a round trip through the broker.
+        :param node: Sampled Node.
+        :param value: Sampled value.
+        """
+        rules = self.rules.get(node.path)
+        if not rules:
+            return
+        now = monotonic()
+        for rule in rules:
+            self.update_rule(rule, value, now)
+
+    def update_rule(self, rule, value, now):
+        """
+        Feed a rule a value and drive its output if it switches. A change
+        still in its debounce time is checked again once the time is up, as
+        inputs such as edges may not send another sample.
+        :param rule: Rule.
+        :param value: Input value.
+        :param now: Monotonic time of the value.
+        """
+        if rule.update(value, now):
+            self.publish(rule.node, rule.active)
+            output_value = rule.output_value()
+            output = self.super_root.get(rule.output_path)
+            if output_value is not None and output is not None:
+                output.set_value(output_value, trigger_callback=True)
+        elif rule.pending_since is not None and rule.node.path not in self.rule_checks:
+            self.rule_checks[rule.node.path] = reactor.callLater(
+                max(0, rule.pending_since + rule.debounce - now), self.check_rule, rule)
+
+    def check_rule(self, rule):
+        """
+        Run a rule again on the current value of its input.
+        :param rule: Rule.
+        """
+        self.rule_checks.pop(rule.node.path, None)
+        input_node = self.super_root.get(rule.input_path)
+        if input_node is None or rule not in self.rules.get(rule.input_path, []):
+            return
+        self.update_rule(rule, input_node.get_value(), monotonic())
+        self.flush_updates()
+
+    def play_sequence(self, parameters):
+        node = parameters.node.parent
+        try:
+            steps = [(parse_output_value(node.get_type(), value), float(duration))
+                     for value, duration in json.loads(parameters.params.get("Steps", ""))]
+        except (ValueError, TypeError):
+            return [["Invalid steps"]]
+        if not steps or any(value is None or duration < 0 for value, duration in steps):
+            return [["Invalid steps"]]
+        if sum(duration for value, duration in steps) <= 0:
+            return [["Sequence has no duration"]]
+        repeat = int(parameters.params.get("Repeat", 1))
+        # A new sequence replaces the one playing.
+        self.cancel_sequence(node)
+        sequence = {
+            "steps": steps,
+            "count": len(steps) * repeat if repeat > 0 else None,
+            "index": 0,
+            "due": monotonic(),
+            "call": None
+        }
+        self.sequences[node.path] = sequence
+        self.play_step(node, sequence)
+        return [["Playing"]]
+
+    def play_step(self, node, sequence):
+        """
+        Write one step of a sequence and schedule the next. Steps are due on
+        a grid from the monotonic start time, so late steps do not push the
+        rest of the sequence back.
+        :param node: Output module Node.
+        :param sequence: Sequence state from play_sequence.
+        """
+        value, duration = sequence["steps"][sequence["index"] % len(sequence["steps"])]
+        node.set_value(value, trigger_callback=True)
+        sequence["index"] += 1
+        sequence["due"] += duration
+        if sequence["count"] is not None and sequence["index"] >= sequence["count"]:
+            self.sequences.pop(node.path, None)
+            return
+        sequence["call"] = reactor.callLater(max(0, sequence["due"] - monotonic()), self.play_step, node, sequence)
+
+    def capture(self, parameters):
+        node = parameters.node.parent
+        if node.path in self.captures:
+            return [["Already capturing"]]
+        duration = parameters.params.get("Duration", 1)
+        count = parameters.params.get("Count")
+        if duration <= 0 or (count is not None and count <= 0):
+            return [["Invalid duration or count"]]
+        # Invokes answer straight away, so the samples are streamed to
+        # Capture Data in chunks while the capture runs.
+        self.captures.add(node.path)
+        reactor.callInThread(self.profiler.wrap(self.capture_worker), node,
+                             self.addresses[node.attributes["@address"]][1], duration, count)
+        return [["Capturing"]]
+
+    def capture_worker(self, node, pin, duration, count):
+        """
+        Sample an analog pin back to back from a worker thread. Each sample
+        claims the bus on its own, so writes and polling get in between.
+        :param node: Analog module Node.
+        :param pin: Analog pin.
+        :param duration: Longest capture in seconds.
+        :param count: Most samples to take, or None.
+        """
+        data = node.get("/capture_data")
+        chunk = []
+        taken = 0
+        started = monotonic()
+        flushed = started
+        now = started
+        while node.path in self.captures and now - started < duration and (count is None or taken < count):
+            try:
+                with bus.claim(SENSOR):
+                    value = self.analog_to_percent(grovepi.analogReadFast(pin))
+            except IOError:
+                value = None
+            now = monotonic()
+            chunk.append([round((now - started) * 1000, 3), value])
+            taken += 1
+            if now - flushed >= self.capture_chunk:
+                reactor.callFromThread(self.publish, data, chunk)
+                chunk = []
+                flushed = now
+        if chunk:
+            reactor.callFromThread(self.publish, data, chunk)
+        rate = taken / (now - started) if now > started else 0
+        reactor.callFromThread(self.finish_capture, node, round(rate, 2))
+
+    def finish_capture(self, node, rate):
+        self.captures.discard(node.path)
+        self.publish(node.get("/capture_rate"), rate)
+        self.flush_updates()
+
+    def set_high_rate(self, node, value):
+        """
+        Switch an accelerometer between polled axes and the high rate motion summary.
+        :param node: High Rate Node.
+        :param value: True for the motion summary.
+        """
+        module = node.parent
+        if value:
+            module.set_attribute("@mode", "motion")
+            self.start_motion(module)
+        else:
+            module.set_attribute("@mode", "input")
+            self.motion.pop(module.path, None)
+        return []
+
+    def start_motion(self, node):
+        if node.path in self.motion:
+            return
+        summary = MotionSummary()
+        self.motion[node.path] = summary
+        # Runs for as long as high rate is on, so it gets its own thread
+        # rather than holding one of the reactor's pool.
+        t = threading.Thread(target=self.profiler.wrap(self.motion_worker), args=(node, summary))
+        t.daemon = True
+        t.start()
+
+    def motion_worker(self, node, summary):
+        """
+        Read accelerometer frames back to back from a worker thread into a
+        summary that each cycle publishes. Each frame claims the bus on its
+        own, so writes and polling get in between.
+        :param node: Accelerometer module Node.
+        :param summary: MotionSummary, the worker stops once it is no longer the module's.
+        """
+        while self.motion.get(node.path) is summary:
+            try:
+                with bus.claim(SENSOR):
+                    frame = grovepi.acc_xyzFast()
+            except IOError:
+                time.sleep(self.motion_retry)
+                continue
+            summary.add(*[to_g(counts) for counts in frame])
+
+    def sample_motion(self, child):
+        """
+        Publish the motion summary of the frames read since the last cycle.
+        :param child: Accelerometer module Node.
+        :return: List of (Node, value, acquisition time) samples.
+        """
+        summary = self.motion.get(child.path)
+        taken = summary.take() if summary is not None else None
+        if taken is None:
+            return []
+        ts = datetime.now()
+        return [(child.get("/motion"), taken[0], ts), (child.get("/peak"), taken[1], ts)]
+
+    def stop_sequence(self, parameters):
+        self.cancel_sequence(parameters.node.parent)
+        return []
+
+    def cancel_sequence(self, node):
+        sequence = self.sequences.pop(node.path, None)
+        if sequence is not None and sequence["call"] is not None and sequence["call"].active():
+            sequence["call"].cancel()
+
+    @staticmethod
+    def enable_counter(module_type, enable):
+        """
+        Start or stop one of the counters kept by the GrovePi firmware.
+        :param module_type: Encoder, Flow Meter or Dust Sensor.
+        :param enable: True to start counting.
+        """
+        if module_type == "Encoder":
+            if enable:
+                grovepi.encoder_en()
+            else:
+                grovepi.encoder_dis()
+        elif module_type == "Flow Meter":
+            if enable:
+                grovepi.flowEnable()
+            else:
+                grovepi.flowDisable()
+        elif module_type == "Dust Sensor":
+            if enable:
+                grovepi.dust_sensor_en()
+            else:
+                grovepi.dust_sensor_dis()
+
     @staticmethod
     def set_digital_node(root, name="Set Digital"):
         slug = name.replace(" ", "_").lower()
@@ -273,6 +1142,338 @@ class GrovePiDSLink(DSLink):
         node.set_invokable("write")
         return node
 
+    def add_modules_node(self, root):
+        node = Node("add_modules", root)
+        node.set_display_name("Add Modules")
+        node.set_profile("add_modules")
+        node.set_parameters([
+            {
+                "name": "Modules",
+                "type": "string",
+                "editor": "textarea",
+                "placeholder": '[{"Name": "light", "Type": "Light Sensor", "Address": "A0"}]'
+            }
+        ])
+        node.set_columns([
+            {
+                "name": "Name",
+                "type": "string"
+            },
+            {
+                "name": "Success",
+                "type": "string"
+            }
+        ])
+        node.set_invokable("config")
+        return node
+
+    @staticmethod
+    def batch_delay_node(root):
+        node = Node("batch_delay", root)
+        node.set_display_name("Max Batch Delay")
+        node.set_type("number")
+        node.set_attribute("@unit", "s")
+        node.set_value(0.5)
+        node.set_config("$writable", "config")
+        return node
+
+    @staticmethod
+    def cache_max_age_node(root):
+        node = Node("cache_max_age", root)
+        node.set_display_name("Max Cache Age")
+        node.set_type("number")
+        node.set_attribute("@unit", "s")
+        node.set_value(5)
+        node.set_config("$writable", "config")
+        return node
+
+    @staticmethod
+    def background_interval_node(root):
+        node = Node("background_interval", root)
+        node.set_display_name("Background Interval")
+        node.set_type("number")
+        node.set_attribute("@unit", "s")
+        node.set_value(0)
+        node.set_config("$writable", "config")
+        return node
+
+    @staticmethod
+    def poll_mode_node(root):
+        node = Node("poll_mode", root)
+        node.set_display_name("Poll Mode")
+        node.set_type(Value.build_enum(["Fixed Delay", "Fixed Rate"]))
+        node.set_value("Fixed Delay")
+        node.set_config("$writable", "config")
+        return node
+
+    def metrics_node(self, root):
+        node = Node("metrics", root)
+        node.set_display_name("Metrics")
+        node.set_transient(True)
+        node.add_child(self.metric_node(node, "messages_sent", "Messages Sent"))
+        node.add_child(self.metric_node(node, "messages_saved", "Messages Saved"))
+        node.add_child(self.metric_node(node, "cycle_time", "Cycle Time", "ms"))
+        node.add_child(self.metric_node(node, "overruns", "Overruns"))
+        node.add_child(self.metric_node(node, "samples_dropped", "Samples Dropped"))
+        node.add_child(self.metric_node(node, "recoveries", "Board Recoveries"))
+        node.add_child(self.metric_node(node, "recovery_time", "Last Recovery Time", "s"))
+        return node
+
+    @staticmethod
+    def metric_node(root, name, display_name, unit=None):
+        node = Node(name, root)
+        node.set_display_name(display_name)
+        node.set_type("number")
+        if unit is not None:
+            node.set_attribute("@unit", unit)
+        node.set_value(0)
+        return node
+
+    @staticmethod
+    def profile_node(root):
+        node = Node("profile", root)
+        node.set_display_name("Profile")
+        node.set_profile("profile")
+        node.set_parameters([
+            {
+                "name": "Duration",
+                "type": "number",
+                "default": 10
+            },
+            {
+                "name": "Dump File",
+                "type": "string"
+            }
+        ])
+        node.set_columns([
+            {
+                "name": "Status",
+                "type": "string"
+            }
+        ])
+        node.set_invokable("config")
+        return node
+
+    @staticmethod
+    def profile_results_node(root):
+        node = Node("profile_results", root)
+        node.set_display_name("Profile Results")
+        node.set_profile("profile_results")
+        node.set_parameters([
+            {
+                "name": "Top",
+                "type": "number",
+                "default": 20
+            },
+            {
+                "name": "Sort",
+                "type": Value.build_enum(["Cumulative Time", "Self Time"])
+            }
+        ])
+        node.set_columns([
+            {
+                "name": "Function",
+                "type": "string"
+            },
+            {
+                "name": "Calls",
+                "type": "number"
+            },
+            {
+                "name": "Self Time",
+                "type": "number"
+            },
+            {
+                "name": "Cumulative Time",
+                "type": "number"
+            }
+        ])
+        node.set_invokable("config")
+        return node
+
+    @staticmethod
+    def read_all_node(root):
+        node = Node("read_all", root)
+        node.set_display_name("Read All")
+        node.set_profile("read_all")
+        node.set_parameters([
+            {
+                "name": "Max Age",
+                "type": "number"
+            }
+        ])
+        node.set_columns([
+            {
+                "name": "Path",
+                "type": "string"
+            },
+            {
+                "name": "Value",
+                "type": "dynamic"
+            },
+            {
+                "name": "Unit",
+                "type": "string"
+            },
+            {
+                "name": "Timestamp",
+                "type": "string"
+            },
+            {
+                "name": "Quality",
+                "type": "string"
+            }
+        ])
+        node.set_invokable("read")
+        return node
+
+    @staticmethod
+    def rules_node(root):
+        node = Node("rules", root)
+        node.set_display_name("Rules")
+        add_rule = Node("add_rule", node)
+        add_rule.set_display_name("Add Rule")
+        add_rule.set_profile("add_rule")
+        add_rule.set_parameters([
+            {
+                "name": "Name",
+                "type": "string"
+            },
+            {
+                "name": "Input",
+                "type": "string",
+                "placeholder": "/button"
+            },
+            {
+                "name": "Condition",
+                "type": Value.build_enum(CONDITIONS)
+            },
+            {
+                "name": "Threshold",
+                "type": "number",
+                "default": 0
+            },
+            {
+                "name": "Hysteresis",
+                "type": "number",
+                "default": 0
+            },
+            {
+                "name": "Debounce",
+                "type": "number",
+                "default": 0
+            },
+            {
+                "name": "Output",
+                "type": "string",
+                "placeholder": "/relay"
+            },
+            {
+                "name": "On Value",
+                "type": "string",
+                "placeholder": "true"
+            },
+            {
+                "name": "Off Value",
+                "type": "string",
+                "placeholder": "false"
+            }
+        ])
+        add_rule.set_columns([
+            {
+                "name": "Success",
+                "type": "string"
+            }
+        ])
+        add_rule.set_invokable("config")
+        node.add_child(add_rule)
+        return node
+
+    @staticmethod
+    def remove_rule_node(root):
+        node = Node("remove_rule", root)
+        node.set_display_name("Remove Rule")
+        node.set_profile("remove_rule")
+        node.set_invokable("config")
+        return node
+
+    @staticmethod
+    def play_sequence_node(root):
+        node = Node("play_sequence", root)
+        node.set_display_name("Play Sequence")
+        node.set_profile("play_sequence")
+        node.set_parameters([
+            {
+                "name": "Steps",
+                "type": "string",
+                "placeholder": "[[true, 0.2], [false, 0.8]]"
+            },
+            {
+                "name": "Repeat",
+                "type": "number",
+                "default": 1
+            }
+        ])
+        node.set_columns([
+            {
+                "name": "Success",
+                "type": "string"
+            }
+        ])
+        node.set_invokable("write")
+        return node
+
+    @staticmethod
+    def capture_node(root):
+        node = Node("capture", root)
+        node.set_display_name("Capture")
+        node.set_profile("capture")
+        node.set_parameters([
+            {
+                "name": "Duration",
+                "type": "number",
+                "default": 1
+            },
+            {
+                "name": "Count",
+                "type": "number"
+            }
+        ])
+        node.set_columns([
+            {
+                "name": "Success",
+                "type": "string"
+            }
+        ])
+        node.set_invokable("read")
+        return node
+
+    @staticmethod
+    def capture_data_node(root):
+        node = Node("capture_data", root)
+        node.set_display_name("Capture Data")
+        node.set_type("array")
+        node.set_transient(True)
+        return node
+
+    @staticmethod
+    def stop_sequence_node(root):
+        node = Node("stop_sequence", root)
+        node.set_display_name("Stop Sequence")
+        node.set_profile("stop_sequence")
+        node.set_invokable("write")
+        return node
+
+    def high_rate_node(self, root):
+        node = Node("high_rate", root)
+        node.set_attribute("@callback", "high_rate")
+        node.set_display_name("High Rate")
+        node.set_type("bool")
+        node.set_value(False)
+        node.set_config("$writable", "write")
+        node.set_value_callback = self.set_high_rate
+        return node
+
     @staticmethod
     def remove_module_node(root):
         node = Node("remove_module", root)
@@ -281,6 +1482,42 @@ class GrovePiDSLink(DSLink):
         node.set_invokable("config")
         return node
 
+    def display_node(self, root, name, display_name, value_type, value=None, editor=None):
+        node = Node(name, root)
+        node.set_attribute("@callback", "display")
+        node.set_display_name(display_name)
+        node.set_type(value_type)
+        if editor is not None:
+            node.set_config("$editor", editor)
+        if value is not None:
+            node.set_value(value)
+        node.set_config("$writable", "write")
+        node.set_value_callback = self.set_display
+        return node
+
+    def four_digit_monitor_node(self, root):
+        node = Node("monitor", root)
+        node.set_display_name("Monitor Analog")
+        node.set_config("$is", "four_digit_monitor")
+        node.set_parameters([
+            {
+                "name": "Analog",
+                "type": Value.build_enum([a for a in self.addresses if self.addresses[a][0] == "analog"])
+            },
+            {
+                "name": "Duration",
+                "type": "number"
+            }
+        ])
+        node.set_columns([
+            {
+                "name": "Success",
+                "type": "string"
+            }
+        ])
+        node.set_invokable("write")
+        return node
+
     def color_node(self, root):
         node = Node("color", root)
         node.set_attribute("@callback", "rgb_color")
@@ -315,49 +1552,427 @@ class GrovePiDSLink(DSLink):
         node.set_attribute("@unit", "%")
         return node
 
+    @staticmethod
+    def reading_node(root, name, display_name, unit=None):
+        node = Node(name, root)
+        node.set_display_name(display_name)
+        node.set_type("number")
+        if unit is not None:
+            node.set_attribute("@unit", unit)
+        return node
+
     def update_values(self):
+        started = monotonic()
+        if self.bus_busy_until is not None and started < self.bus_busy_until:
+            self.next_tick = None
+            reactor.callLater(self.bus_busy_until - started, self.update_values)
+            return
+        self.bus_busy_until = None
+        if self.acquisition is None:
+            hold = self.watchdog.check(started)
+            if hold is not None:
+                # The board is not answering, stop polling it until the next attempt.
+                self.bus_busy_until = hold
+                self.next_tick = None
+                reactor.callLater(hold - started, self.update_values)
+                return
+        if self.next_tick is None:
+            self.next_tick = started
+        if self.acquisition is not None:
+            self.collect_acquired()
         for child_name in self.super_root.children:
             child = self.super_root.children[child_name]
+            if self.is_acquired(child):
+                continue
             try:
-                if child.is_subscribed() and "@type" in child.attributes and "@mode" in child.attributes and child.attributes["@mode"] == "input":
-                    address = self.addresses[child.attributes["@address"]][1]
-                    port_type = child.attributes["@type"]
-                    module = child.attributes["@module"]
-                    if port_type == "pwm" or port_type == "digital":
-                        if module == "Ultrasonic Ranger":
-                            try:
-                                child.set_value(grovepi.ultrasonicRead(address))
-                            except TypeError:
-                                pass
-                        else:
-                            val = grovepi.digitalRead(address)
-                            if val != 255:
-                                child.set_value(bool(val))
-                    elif port_type == "analog":
-                        child.set_value(self.analog_to_percent(grovepi.analogRead(address)))
-                    elif port_type == "i2c":
-                        pass
-                    else:
-                        raise ValueError("Unhandled type %s" % child.attributes["@type"])
-                elif "@type" in child.attributes and "@mode" in child.attributes and child.attributes["@mode"] == "input":
-                    module = child.attributes["@module"]
-                    address = self.addresses[child.attributes["@address"]][1]
-                    if module == "Temp and Humid":
-                        temp = child.get("/temp")
-                        humid = child.get("/humid")
-                        if temp.is_subscribed() or humid.is_subscribed():
-                            dht = grovepi.dht(address, 0)
-                            if type(dht) is list and not isnan(dht[0]) and not isnan(dht[1]):
-                                temp.set_value(dht[0])
-                                humid.set_value(dht[1])
-
+                with bus.claim(SENSOR):
+                    samples = self.sample_module(child)
+                for node, value, ts in samples:
+                    self.publish(node, value, ts)
+                    self.evaluate_rules(node, value)
             except IOError:
                 pass
 
         if self.super_root.get("/poll_speed").get_value() is None:
             self.super_root.get("/poll_speed").set_value(0.1)
-        reactor.callLater(self.super_root.get("/poll_speed").get_value(), self.update_values)
+        delay = self.next_delay(started)
+
+        self.flush_updates()
+        reactor.callLater(delay, self.update_values)
+
+    @staticmethod
+    def probe_board():
+        """
+        Check that the GrovePi answers.
+        :return: True if the firmware version could be read without a bus error.
+        """
+        try:
+            grovepi.version()
+        except (IOError, TypeError):
+            return False
+        return bus.failures == 0
+
+    def board_recovered(self, duration):
+        """
+        Set the board up again after the watchdog got it answering.
+        :param duration: Seconds since the last good transaction.
+        """
+        with bus.claim(ACTUATOR):
+            self.restore(self.super_root)
+        self.recoveries += 1
+        metrics = self.super_root.get("/metrics")
+        self.publish(metrics.get("/recoveries"), self.recoveries)
+        self.publish(metrics.get("/recovery_time"), round(duration, 3))
+
+    def next_delay(self, started):
+        """
+        Work out how long to wait before the next acquisition cycle.
+        Fixed Delay waits Poll Speed after the cycle finishes, Fixed Rate keeps
+        cycles on a grid anchored to the monotonic clock and skips the ticks
+        that an overrunning cycle has already passed.
+        :param started: Monotonic time the cycle started.
+        :return: Delay in seconds.
+        """
+        poll_speed = self.super_root.get("/poll_speed").get_value()
+        now = monotonic()
+        metrics = self.super_root.get("/metrics")
+        self.publish(metrics.get("/cycle_time"), round((now - started) * 1000, 3))
+        if self.super_root.get("/poll_mode").get_value() != "Fixed Rate" or poll_speed <= 0:
+            self.next_tick = None
+            return poll_speed
+        self.next_tick += poll_speed
+        if now > self.next_tick:
+            skipped = int((now - self.next_tick) / poll_speed) + 1
+            self.next_tick += skipped * poll_speed
+            self.overruns += skipped
+            self.publish(metrics.get("/overruns"), self.overruns)
+        return self.next_tick - now
+
+    def collect_acquired(self):
+        """
+        Publish the samples the acquisition process has taken since the last
+        cycle and hand it the current scan list.
+        """
+        if self.acquisition.ensure_running():
+            # A new process starts with the board as it was left, set it up again.
+            self.restore(self.super_root)
+        jobs = []
+        for child_name in self.super_root.children:
+            child = self.super_root.children[child_name]
+            job = self.scan_job(child) if self.is_acquired(child) else None
+            if job is not None:
+                jobs.append(job)
+        self.acquisition.set_scan(jobs, self.super_root.get("/poll_speed").get_value() or 0.1)
+        for node, value, ts in self.acquisition.read():
+            self.publish(node, value, datetime.fromtimestamp(ts))
+            self.evaluate_rules(node, value)
+        dropped = self.super_root.get("/metrics/samples_dropped")
+        if dropped.get_value() != self.acquisition.ring.dropped:
+            self.publish(dropped, self.acquisition.ring.dropped)
 
+    def input_job(self, child):
+        """
+        Describe the read of a polled input module.
+        :param child: Module Node.
+        :return: (Nodes, module, port type, pin), or None if the module is not polled.
+        """
+        if "@type" not in child.attributes or child.attributes.get("@mode") != "input":
+            return None
+        module = child.attributes["@module"]
+        port_type = child.attributes["@type"]
+        address = self.addresses[child.attributes["@address"]][1]
+        if module == "Temp and Humid":
+            nodes = [child.get("/temp"), child.get("/humid")]
+        elif module == "Accelerometer":
+            nodes = [child.get("/x"), child.get("/y"), child.get("/z")]
+        elif port_type in ["pwm", "digital", "analog", "i2c"]:
+            nodes = [child]
+        else:
+            raise ValueError("Unhandled type %s" % port_type)
+        return nodes, module, port_type, address
+
+    def is_acquired(self, child):
+        """
+        Whether the acquisition process samples a module, rather than the cycle.
+        :param child: Module Node.
+        :return: True if its samples come from the ring.
+        """
+        return (self.acquisition is not None and child.attributes.get("@mode") == "input"
+                and child.attributes["@module"] not in self.text_modules)
+
+    def scan_job(self, child):
+        """
+        Work out whether a polled input module needs reading this cycle.
+        :param child: Module Node.
+        :return: (Nodes, module, port type, pin), or None if nothing wants its values.
+        """
+        job = self.input_job(child)
+        if job is None:
+            return None
+        if any(self.is_wanted(node) for node in job[0]) or self.is_background_due(child, job[0]):
+            return job
+        return None
+
+    def is_background_due(self, child, nodes):
+        """
+        Whether a slow module nobody is subscribed to is due a background
+        read, to keep its cached values warm for the next subscriber.
+        :param child: Module Node.
+        :param nodes: Its value Nodes.
+        :return: True if it should be read.
+        """
+        interval = self.super_root.get("/background_interval").get_value()
+        if not interval or child.attributes["@module"] not in self.slow_modules:
+            return False
+        ages = [self.cache_age(node) for node in nodes]
+        return any(age is None or age >= interval for age in ages)
+
+    def acquired_at(self, node):
+        """
+        :param node: Value Node.
+        :return: Time its value was acquired or written since start, or None.
+        """
+        if not node.value.has_value() or node.value.updated_at is self.loaded.get(node.path):
+            return None
+        return node.value.updated_at
+
+    def cache_age(self, node):
+        """
+        :param node: Value Node.
+        :return: Seconds since its value was acquired, or None if it has none since start.
+        """
+        ts = self.acquired_at(node)
+        if ts is None:
+            return None
+        return (datetime.now() - ts).total_seconds()
+
+    def subscribed(self, node, sid):
+        """
+        Send a new subscriber its first value. A polled input is sent its
+        cached value only if that was acquired since start and is within
+        Max Cache Age. Otherwise its module is read again soon after, rather
+        than waiting for the next cycle, and the read delivers the value.
+        Other Nodes are sent whatever value they hold.
+        :param node: Subscribed Node.
+        :param sid: Subscription ID.
+        """
+        module = node if "@module" in node.attributes else node.parent
+        job = self.input_job(module) if module is not None and module.parent is self.super_root else None
+        if job is not None and node in job[0]:
+            age = self.cache_age(node)
+            max_age = self.super_root.get("/cache_max_age").get_value()
+            if age is None or (max_age is not None and age > max_age):
+                # Subscribe requests can name many paths, so the reads are
+                # left until the request has been handled, one per module.
+                self.refresh_due[module.path] = module
+                if self.refresh_call is None:
+                    self.refresh_call = reactor.callLater(0, self.refresh)
+                return
+        if node.value.has_value():
+            self.pending_updates.append([sid, node.value.value, node.value.updated_at.isoformat()])
+            self.flush_updates()
+
+    def refresh(self):
+        """
+        Read the polled input modules of new subscriptions, outside the cycle.
+        While the bus is held off, the cycle after the hold reads them anyway.
+        """
+        self.refresh_call = None
+        modules = list(self.refresh_due.values())
+        self.refresh_due.clear()
+        if self.bus_busy_until is not None and monotonic() < self.bus_busy_until:
+            return
+        for module in modules:
+            # Skip modules removed since they were queued.
+            job = self.input_job(module) if self.super_root.children.get(module.name) is module else None
+            if job is None:
+                continue
+            nodes, module_type, port_type, address = job
+            try:
+                ts = datetime.now()
+                values = self.read_input(module_type, port_type, address)
+            except IOError:
+                continue
+            for value_node, value in zip(nodes, values):
+                self.publish(value_node, value, ts)
+                self.evaluate_rules(value_node, value)
+        self.flush_updates()
+
+    def read_input(self, module, port_type, address):
+        """
+        Read a polled input module outside of the acquisition cycle.
+        :return: List of values, see read_module.
+        """
+        if self.acquisition is not None:
+            return self.acquisition.read_module(module, port_type, address)
+        with bus.claim(SENSOR):
+            return read_module(module, port_type, address)
+
+    def is_wanted(self, node):
+        """
+        Whether a value needs reading, because it is subscribed or a rule watches it.
+        :param node: Value Node.
+        :return: True if it should be read.
+        """
+        return node.is_subscribed() or node.path in self.rules
+
+    def sample_module(self, child):
+        """
+        Read a module's inputs.
+        :param child: Module Node.
+        :return: List of (Node, value, acquisition time) samples.
+        """
+        if child.attributes.get("@mode") == "counter":
+            return self.sample_counter(child)
+        if child.attributes.get("@mode") == "motion":
+            return self.sample_motion(child)
+        job = self.scan_job(child)
+        if job is None:
+            return []
+        nodes, module, port_type, address = job
+        ts = datetime.now()
+        return [(node, value, ts) for node, value in zip(nodes, self.read_input(module, port_type, address))]
+
+    def sample_counter(self, child):
+        """
+        Read a firmware counter at counter_interval and derive rates from it.
+        The counters keep running on the Arduino, so they are read whether or
+        not anything is subscribed.
+        :param child: Counter module Node.
+        :return: List of (Node, value, acquisition time) samples.
+        """
+        now = monotonic()
+        last = self.counters.get(child.path)
+        module = child.attributes["@module"]
+        if module == "Encoder":
+            return self.sample_encoder(child, now, last)
+        if last is not None and now - last[0] < self.counter_interval:
+            return []
+        ts = datetime.now()
+        samples = []
+        if module == "Flow Meter":
+            flag, flow = grovepi.flowRead()
+            if flag == -1:
+                return []
+            # The firmware reports litres per hour.
+            rate = flow / 60.0
+            total = child.get("/total").get_value() or 0
+            if last is not None:
+                total += rate * (now - last[0]) / 60.0
+            samples.append((child.get("/rate"), rate, ts))
+            samples.append((child.get("/total"), total, ts))
+            self.counters[child.path] = (now, flow)
+        elif module == "Dust Sensor":
+            flag, occupancy = grovepi.dustSensorRead()
+            self.counters[child.path] = (now, occupancy)
+            # The flag is only set once per sampling window.
+            if flag != 1:
+                return []
+            ratio = occupancy / (self.dust_window * 10.0)
+            concentration = 1.1 * ratio ** 3 - 3.8 * ratio ** 2 + 520 * ratio + 0.62
+            samples.append((child.get("/occupancy"), ratio, ts))
+            samples.append((child.get("/concentration"), concentration, ts))
+        return samples
+
+    def sample_encoder(self, child, now, last):
+        """
+        Read the encoder position every cycle and publish its rate every
+        counter_interval. The position wraps at encoder_steps, so a turn of
+        half a revolution or more between two reads looks like a turn the
+        other way, which limits Rate to encoder_steps / 2 steps per cycle.
+        The fast read keeps each cycle at Poll Speed, so that is also the
+        limit per Poll Speed as long as cycles do not overrun.
+        :param child: Encoder module Node.
+        :param now: Monotonic time of the read.
+        :param last: (Rate window start, last position, steps in the window), or None.
+        :return: List of (Node, value, acquisition time) samples.
+        """
+        flag, position = grovepi.encoderReadFast()
+        if flag == -1:
+            return []
+        ts = datetime.now()
+        samples = [(child.get("/position"), position, ts)]
+        if last is None:
+            self.counters[child.path] = (now, position, 0)
+            return samples
+        started, previous, steps = last
+        steps += (position - previous + self.encoder_steps / 2) % self.encoder_steps - self.encoder_steps / 2
+        if now - started >= self.counter_interval:
+            samples.append((child.get("/rate"), steps / (now - started), ts))
+            self.counters[child.path] = (now, position, 0)
+        else:
+            self.counters[child.path] = (started, position, steps)
+        return samples
+
+    def publish(self, node, value, ts=None):
+        """
+        Set a Node's value, queueing the subscriber updates for the end of the cycle.
+        :param node: Node to update.
+        :param value: New value.
+        :param ts: Time the value was acquired, defaults to now.
+        """
+        if not node.value.set_value(value):
+            return
+        if ts is not None:
+            node.value.updated_at = ts
+        if self.is_saved(node):
+            self.nodes_changed = True
+        if node.value.has_value():
+            for sid in node.subscribers:
+                self.pending_updates.append([sid, node.value.value, node.value.updated_at.isoformat()])
+        if self.pending_updates:
+            now = monotonic()
+            if self.batch_started is None:
+                self.batch_started = now
+            max_delay = self.super_root.get("/batch_delay").get_value()
+            if max_delay is None or now - self.batch_started >= max_delay:
+                self.flush_updates()
+            elif self.batch_call is None:
+                # Updates queued outside the cycle, such as edges and capture
+                # chunks, still go out once the delay is up.
+                self.batch_call = reactor.callLater(max_delay - (now - self.batch_started), self.flush_updates)
+
+    @staticmethod
+    def is_saved(node):
+        """
+        :param node: Node.
+        :return: False if it or one of its parents is transient, and so left out of nodes.json.
+        """
+        while node is not None:
+            if node.transient:
+                return False
+            node = node.parent
+        return True
+
+    def flush_updates(self):
+        """
+        Send all queued value updates to the broker as a single response.
+        """
+        self.batch_started = None
+        if self.batch_call is not None and self.batch_call.active():
+            self.batch_call.cancel()
+        self.batch_call = None
+        if not self.pending_updates:
+            return
+        updates = self.pending_updates
+        self.pending_updates = []
+        self.messages_sent += 1
+        self.messages_saved += len(updates) - 1
+        metrics = self.super_root.get("/metrics")
+        for name in ["messages_sent", "messages_saved"]:
+            node = metrics.get("/" + name)
+            node.value.set_value(getattr(self, name))
+            for sid in node.subscribers:
+                updates.append([sid, node.value.value, node.value.updated_at.isoformat()])
+        if self.wsp is not None:
+            self.wsp.sendMessage({
+                "responses": [
+                    {
+                        "rid": 0,
+                        "updates": updates
+                    }
+                ]
+            })
 
     def module_enum(self):
         i = []
@@ -371,6 +1986,10 @@ class GrovePiDSLink(DSLink):
             i.append(address)
         return Value.build_enum(i)
 
+    @staticmethod
+    def clamp(val, low, high):
+        return max(low, min(high, int(val)))
+
     @staticmethod
     def pwm_to_percent(val):
         return (val / float(255)) * 100
@@ -389,4 +2008,10 @@ class GrovePiDSLink(DSLink):
 
 
 if __name__ == "__main__":
+    if os.environ.get("GROVEPI_ACQUISITION") == "process":
+        # Fork before the reactor and its thread pool start. From here on the
+        # driver modules are proxies and every bus access goes through the pipe.
+        GrovePiDSLink.acquisition = AcquisitionProcess()
+        grovepi = GrovePiDSLink.acquisition.driver("dsa_grovepi")
+        grove_rgb_led = GrovePiDSLink.acquisition.driver("grove_rgb_led")
     GrovePiDSLink(Configuration(name="GrovePi", responder=True))
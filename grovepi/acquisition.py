@@ -0,0 +1,321 @@
+"""
+Optional split of acquisition into its own process.
+
+The acquisition process owns the GrovePi bus. It samples the scan list it
+is given on a fixed-rate schedule and writes timestamped samples into a
+shared memory ring buffer, which the DSLink process drains and publishes.
+Everything else the DSLink process wants done on the bus goes over a pipe
+as driver calls, handled between sensor reads so writes are not held up by
+a full scan. This keeps bus timing away from JSON encoding, websocket
+traffic and the GIL of the DSLink process, and puts the work on two cores.
+"""
+import ctypes
+import multiprocessing
+import sys
+import threading
+import time
+from math import isnan
+
+import dsa_grovepi as grovepi
+import grove_rgb_led
+from clock import monotonic
+from i2c_bus import bus, ACTUATOR, SENSOR
+from motion import to_g
+
+# Driver functions whose result the DSLink process needs. Every other
+# driver call is sent without waiting for it to finish.
+READ_CALLS = set([
+    "read_module",
+    "digitalRead",
+    "analogRead",
+    "analogReadFast",
+    "ultrasonicRead",
+    "dht",
+    "version",
+    "acc_xyz",
+    "acc_xyzFast",
+    "rtc_getTime",
+    "rtc_getTimeFast",
+    "encoderRead",
+    "encoderReadFast",
+    "flowRead",
+    "dustSensorRead",
+    "ledBar_getBits"
+])
+
+DRIVERS = {
+    "dsa_grovepi": grovepi,
+    "grove_rgb_led": grove_rgb_led,
+    "acquisition": sys.modules[__name__]
+}
+
+
+def read_module(module, port_type, pin):
+    """
+    Read one polled input module.
+    :param module: Module type.
+    :param port_type: digital, pwm, analog or i2c.
+    :param pin: GrovePi pin.
+    :return: List of values, one per channel of the module, or empty if the read was invalid.
+    """
+    if module == "Temp and Humid":
+        dht = grovepi.dht(pin, 0)
+        if type(dht) is list and not isnan(dht[0]) and not isnan(dht[1]):
+            return dht
+    elif module == "Accelerometer":
+        # All three axes come from one frame.
+        return [to_g(counts) for counts in grovepi.acc_xyzFast()]
+    elif module == "RTC":
+        hour, minute, second, month, day, year = grovepi.rtc_getTimeFast()
+        return ["%04d-%02d-%02dT%02d:%02d:%02d" % (2000 + year, month, day, hour, minute, second)]
+    elif port_type == "pwm" or port_type == "digital":
+        if module == "Ultrasonic Ranger":
+            try:
+                return [grovepi.ultrasonicRead(pin)]
+            except TypeError:
+                pass
+        else:
+            val = grovepi.digitalRead(pin)
+            if val != 255:
+                return [bool(val)]
+    elif port_type == "analog":
+        return [(grovepi.analogRead(pin) / float(1023)) * 100]
+    return []
+
+
+class SampleRing(object):
+    """
+    Single writer, single reader ring of (channel, time, value) samples in
+    shared memory. Each slot carries the sequence number of the sample in
+    it, written last, so the reader can spot slots it lost to the writer.
+    """
+    FIELDS = 4
+
+    def __init__(self, capacity=4096):
+        """
+        SampleRing Constructor.
+        :param capacity: Number of samples held.
+        """
+        self.capacity = capacity
+        self.data = multiprocessing.RawArray("d", capacity * self.FIELDS)
+        self.head = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self.tail = 0
+        self.dropped = 0
+
+    def write(self, channel, ts, value):
+        n = self.head.value
+        slot = (n % self.capacity) * self.FIELDS
+        self.data[slot] = 0
+        self.data[slot + 1] = channel
+        self.data[slot + 2] = ts
+        self.data[slot + 3] = value
+        self.data[slot] = n + 1
+        self.head.value = n + 1
+
+    def read(self):
+        """
+        Take every sample written since the last read.
+        :return: List of (channel, time, value).
+        """
+        head = self.head.value
+        if head - self.tail > self.capacity:
+            self.dropped += head - self.tail - self.capacity
+            self.tail = head - self.capacity
+        samples = []
+        while self.tail < head:
+            slot = (self.tail % self.capacity) * self.FIELDS
+            seq, channel, ts, value = self.data[slot:slot + self.FIELDS]
+            self.tail += 1
+            if seq != self.tail or self.data[slot] != seq:
+                self.dropped += 1
+                continue
+            samples.append((int(channel), ts, value))
+        return samples
+
+
+def run(ring, conn):
+    """
+    Acquisition process main loop.
+    :param ring: SampleRing to write samples to.
+    :param conn: Command pipe from the DSLink process.
+    """
+    # A replacement is forked from the running link, whose threads may have
+    # held the bus at the time.
+    bus.reset_claims()
+    scan = ([], 0.1)
+    next_tick = monotonic()
+    while scan is not None:
+        jobs, period = scan
+        for channels, module, port_type, pin in jobs:
+            scan = handle_commands(conn, 0, scan)
+            if scan is None or scan[0] is not jobs:
+                break
+            with bus.claim(SENSOR):
+                ts = time.time()
+                try:
+                    values = read_module(module, port_type, pin)
+                except IOError:
+                    continue
+            for channel, value in zip(channels, values):
+                ring.write(channel, ts, value)
+        else:
+            next_tick += period
+            now = monotonic()
+            if now > next_tick:
+                next_tick += (int((now - next_tick) / period) + 1) * period
+            # Wait on the pipe rather than sleeping so writes go out straight away.
+            while scan is not None and scan[0] is jobs:
+                now = monotonic()
+                if now >= next_tick:
+                    break
+                scan = handle_commands(conn, next_tick - now, scan)
+            continue
+        next_tick = monotonic()
+
+
+def handle_commands(conn, timeout, scan):
+    """
+    Run the commands waiting on the pipe.
+    :param conn: Command pipe.
+    :param timeout: Seconds to wait for the first command.
+    :param scan: Current (jobs, period).
+    :return: The (jobs, period) to carry on with, or None to stop.
+    """
+    while conn.poll(timeout):
+        timeout = 0
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return None
+        if msg[0] == "stop":
+            return None
+        elif msg[0] == "scan":
+            scan = (msg[1], msg[2])
+        elif msg[0] == "call":
+            module, name, args, reply = msg[1:]
+            call = getattr(DRIVERS[module], name)
+            if module == "grove_rgb_led":
+                # The LCD writer thread claims the bus a chunk at a time beside the scan.
+                call(*args)
+                continue
+            try:
+                with bus.claim(ACTUATOR):
+                    value = call(*args)
+            except Exception as e:
+                value = e
+            if reply:
+                conn.send(value)
+    return scan
+
+
+class RemoteDriver(object):
+    """
+    Stands in for a driver module in the DSLink process, forwarding calls to
+    the acquisition process.
+    """
+
+    def __init__(self, acquisition, module):
+        self.acquisition = acquisition
+        self.module = module
+
+    def __getattr__(self, name):
+        def call(*args):
+            return self.acquisition.call(self.module, name, args, name in READ_CALLS)
+        return call
+
+
+class AcquisitionProcess(object):
+    """
+    DSLink side of the acquisition process.
+    """
+
+    def __init__(self, capacity=4096):
+        """
+        AcquisitionProcess Constructor.
+        :param capacity: Samples held by the ring buffer.
+        """
+        self.ring = SampleRing(capacity)
+        self.lock = threading.Lock()
+        self.conn = None
+        self.process = None
+        self.scan = None
+        self.channels = {}
+        self.nodes = {}
+        self.next_channel = 1
+        self.start()
+
+    def start(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=run, args=(self.ring, child))
+        self.process.daemon = True
+        self.process.start()
+        self.scan = None
+
+    def ensure_running(self):
+        """
+        Restart the acquisition process if it died.
+        :return: True if it had to be restarted.
+        """
+        if self.process.is_alive():
+            return False
+        self.start()
+        return True
+
+    def driver(self, module):
+        return RemoteDriver(self, module)
+
+    def call(self, module, name, args, reply):
+        with self.lock:
+            self.conn.send(("call", module, name, args, reply))
+            if not reply:
+                return None
+            try:
+                value = self.conn.recv()
+            except EOFError:
+                # Fails like a bus error, the next cycle restarts the process.
+                raise IOError("Acquisition process stopped")
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def read_module(self, module, port_type, pin):
+        return self.call("acquisition", "read_module", (module, port_type, pin), True)
+
+    def set_scan(self, jobs, period):
+        """
+        Hand the acquisition process a new scan list if it changed.
+        :param jobs: List of (Nodes, module, port type, pin).
+        :param period: Seconds between scans.
+        """
+        scan = []
+        nodes = {}
+        for job_nodes, module, port_type, pin in jobs:
+            channels = []
+            for node in job_nodes:
+                if node.path not in self.channels:
+                    self.channels[node.path] = self.next_channel
+                    self.next_channel += 1
+                channels.append(self.channels[node.path])
+                nodes[self.channels[node.path]] = node
+            scan.append((channels, module, port_type, pin))
+        self.nodes = nodes
+        self.channels = dict((node.path, channel) for channel, node in nodes.items())
+        if (scan, period) != self.scan:
+            self.scan = (scan, period)
+            with self.lock:
+                self.conn.send(("scan", scan, period))
+
+    def read(self):
+        """
+        Drain the ring buffer.
+        :return: List of (Node, value, acquisition time).
+        """
+        samples = []
+        for channel, ts, value in self.ring.read():
+            node = self.nodes.get(channel)
+            if node is None:
+                continue
+            if node.get_type() == "bool":
+                value = bool(value)
+            samples.append((node, value, ts))
+        return samples
@@ -0,0 +1,34 @@
+import ctypes
+import ctypes.util
+import time
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2 has no monotonic clock, so read CLOCK_MONOTONIC through librt.
+    CLOCK_MONOTONIC = 1
+
+    class _Timespec(ctypes.Structure):
+        _fields_ = [
+            ("tv_sec", ctypes.c_long),
+            ("tv_nsec", ctypes.c_long)
+        ]
+
+    try:
+        _clock_gettime = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1", use_errno=True).clock_gettime
+        _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+    except (OSError, AttributeError):
+        _clock_gettime = None
+
+    def monotonic():
+        """
+        Seconds from an arbitrary point that never goes backwards.
+        Falls back to the wall clock when librt is unavailable.
+        :return: Monotonic time in seconds.
+        """
+        if _clock_gettime is None:
+            return time.time()
+        t = _Timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            return time.time()
+        return t.tv_sec + t.tv_nsec * 1e-9
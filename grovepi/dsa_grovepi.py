@@ -41,13 +41,13 @@ THE SOFTWARE.
 # Last Updated: 01 June 2015
 # http://www.dexterindustries.com/
 
-import smbus
 import time
 import math
-import RPi.GPIO as GPIO
 import struct
 import sys
 
+from i2c_bus import bus
+
 debug = 0
 
 if sys.version_info < (3, 0):
@@ -55,12 +55,6 @@ if sys.version_info < (3, 0):
 else:
     p_version = 3
 
-rev = GPIO.RPI_REVISION
-if rev == 2 or rev == 3:
-    bus = smbus.SMBus(1)
-else:
-    bus = smbus.SMBus(0)
-
 # I2C Address of Arduino
 address = 0x04
 
@@ -223,6 +217,16 @@ def analogRead(pin):
     return number[1] * 256 + number[2]
 
 
+# Read analog value from Pin without the trailing delay, for back to back reads.
+# A settle time shorter than the firmware needs returns the previous reading.
+def analogReadFast(pin, settle=0.002):
+    bus.write_i2c_block_data(address, 1, aRead_cmd + [pin, unused, unused])
+    time.sleep(settle)
+    bus.read_byte(address)
+    number = bus.read_i2c_block_data(address, 1)
+    return number[1] * 256 + number[2]
+
+
 # Write PWM
 def analogWrite(pin, value):
     write_i2c_block(address, aWrite_cmd + [pin, value, unused])
@@ -277,6 +281,16 @@ def acc_xyz():
     return (number[1], number[2], number[3])
 
 
+# Read accelerometer XYZ counts in one block, without the trailing delay, for back to back reads.
+# The firmware sends each axis as a signed byte.
+def acc_xyzFast(settle=0.01):
+    bus.write_i2c_block_data(address, 1, acc_xyz_cmd + [unused, unused, unused])
+    time.sleep(settle)
+    bus.read_byte(address)
+    number = bus.read_i2c_block_data(address, 1)
+    return tuple(n - 256 if n > 127 else n for n in number[1:4])
+
+
 # Read from Grove RTC
 def rtc_getTime():
     write_i2c_block(address, rtc_getTime_cmd + [unused, unused, unused])
@@ -286,6 +300,16 @@ def rtc_getTime():
     return number
 
 
+# Read from Grove RTC without the trailing delay.
+# Returns hour, minute, second, month, day and year since 2000.
+def rtc_getTimeFast(settle=0.01):
+    bus.write_i2c_block_data(address, 1, rtc_getTime_cmd + [unused, unused, unused])
+    time.sleep(settle)
+    bus.read_byte(address)
+    number = bus.read_i2c_block_data(address, 1)
+    return number[1:7]
+
+
 # Read and return temperature and humidity from Grove DHT Pro
 def dht(pin, module_type):
     write_i2c_block(address, dht_temp_cmd + [pin, module_type, unused])
@@ -441,11 +465,18 @@ def fourDigit_score(pin, left, right):
 # analog: analog pin to read
 # duration: analog read for this many seconds
 def fourDigit_monitor(pin, analog, duration):
-    write_i2c_block(address, fourDigitAnalogRead_cmd + [pin, analog, duration])
+    fourDigit_monitor_start(pin, analog, duration)
     time.sleep(duration + .05)
     return 1
 
 
+# Grove 4 Digit Display - start fourDigit_monitor without waiting for it to finish
+# the firmware is busy and ignores other commands until duration has passed
+def fourDigit_monitor_start(pin, analog, duration):
+    write_i2c_block(address, fourDigitAnalogRead_cmd + [pin, analog, duration])
+    return 1
+
+
 # Grove 4 Digit Display - turn entire display on (88:88)
 def fourDigit_on(pin):
     write_i2c_block(address, fourDigitAllOn_cmd + [pin, unused, unused])
@@ -581,6 +612,17 @@ def encoderRead():
         return [-1, -1]
 
 
+# Read the encoder without the 0.2 s wait, for reads every acquisition cycle.
+def encoderReadFast(settle=0.01):
+    bus.write_i2c_block_data(address, 1, encoder_read_cmd + [unused, unused, unused])
+    time.sleep(settle)
+    data_back = bus.read_i2c_block_data(address, 1)[0:2]
+    if data_back[0] != 255:
+        return [data_back[0], data_back[1]]
+    else:
+        return [-1, -1]
+
+
 def flowDisable():
     write_i2c_block(address, flow_disable_cmd + [unused, unused, unused])
     time.sleep(.2)
@@ -20,21 +20,19 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 '''
-import smbus
+import threading
 import time
+from collections import OrderedDict
 
-import RPi.GPIO as GPIO
+from i2c_bus import bus, DISPLAY
 
 # This device has two I2C addresses.
 DISPLAY_RGB_ADDR = 0x62
 DISPLAY_TEXT_ADDR = 0x3e
 
-# Use the bus that matches your Raspberry Pi's version
-rev = GPIO.RPI_REVISION
-if rev == 2 or rev == 3:
-    bus = smbus.SMBus(1)
-else:
-    bus = smbus.SMBus(0)
+# Keeps whole screen updates from interleaving with each other. The bus is
+# only claimed a chunk at a time, so sensor reads can run in between.
+lcd_lock = threading.Lock()
 
 
 def set_rgb(r, g, b):
@@ -44,12 +42,13 @@ def set_rgb(r, g, b):
     :param g: Green(0-255).
     :param b: Blue(0-255).
     """
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 0, 0)
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 1, 0)
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 0x08, 0xaa)
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 4, r)
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 3, g)
-    bus.write_byte_data(DISPLAY_RGB_ADDR, 2, b)
+    with bus.claim(DISPLAY):
+        bus.write_byte_data(DISPLAY_RGB_ADDR, 0, 0)
+        bus.write_byte_data(DISPLAY_RGB_ADDR, 1, 0)
+        bus.write_byte_data(DISPLAY_RGB_ADDR, 0x08, 0xaa)
+        bus.write_byte_data(DISPLAY_RGB_ADDR, 4, r)
+        bus.write_byte_data(DISPLAY_RGB_ADDR, 3, g)
+        bus.write_byte_data(DISPLAY_RGB_ADDR, 2, b)
 
 
 def text_command(cmd):
@@ -60,15 +59,48 @@ def text_command(cmd):
     bus.write_byte_data(DISPLAY_TEXT_ADDR, 0x80, cmd)
 
 
+def write_row(row, text):
+    """
+    Write one row of text, claiming the bus only for this row. The controller
+    takes any number of data bytes after the 0x40 control byte, so the whole
+    row goes out as one block transfer.
+    :param row: Row(0-1).
+    :param text: Up to 16 characters.
+    """
+    with bus.claim(DISPLAY):
+        text_command(0x80 if row == 0 else 0xc0)
+        if text:
+            bus.write_i2c_block_data(DISPLAY_TEXT_ADDR, 0x40, [ord(c) for c in text[:16]])
+
+
 def blank_screen():
     """
     Clear the screen without flashing.
     :return:
     """
-    text_command(0x02)
-    for i in range(32):
-        bus.write_byte_data(DISPLAY_TEXT_ADDR, 0x40, ord(" "))
-    text_command(0x02)
+    with lcd_lock:
+        write_row(0, " " * 16)
+        write_row(1, " " * 16)
+        with bus.claim(DISPLAY):
+            text_command(0x02)
+
+
+def text_rows(text):
+    """
+    Split text into the display's rows, wrapping at 16 characters or \n.
+    :param text: Text to split.
+    :return: List of up to two rows.
+    """
+    rows = [""]
+    for c in text:
+        if c == '\n' or len(rows[-1]) == 16:
+            if len(rows) == 2:
+                break
+            rows.append("")
+            if c == '\n':
+                continue
+        rows[-1] += c
+    return rows
 
 
 def set_text(input_text):
@@ -84,21 +116,76 @@ def set_text(input_text):
         text += j
     text = text.ljust(32)
     print(text)
-    text_command(0x02)  # Reset cursor's position
-    time.sleep(0.05)
-    text_command(0x08 | 0x04)  # Display on, no cursor.
-    text_command(0x28)  # 2 lines.
-    time.sleep(0.05)
-    count = 0
-    row = 0
-    for c in text:
-        if c == '\n' or count == 16:
-            count = 0
-            row += 1
-            if row == 2:
-                break
-            text_command(0xc0)
-            if c == '\n':
-                continue
-        count += 1
-        bus.write_byte_data(DISPLAY_TEXT_ADDR, 0x40, ord(c))
+    with lcd_lock:
+        with bus.claim(DISPLAY):
+            text_command(0x02)  # Reset cursor's position
+        time.sleep(0.05)
+        with bus.claim(DISPLAY):
+            text_command(0x08 | 0x04)  # Display on, no cursor.
+            text_command(0x28)  # 2 lines.
+        time.sleep(0.05)
+        for row, row_text in enumerate(text_rows(text)):
+            write_row(row, row_text)
+
+
+class LcdWriter(object):
+    """
+    Writes the display from a single worker thread, so writes land in the
+    order they were asked for. A text or colour replaced before the worker
+    gets to it is skipped, only the latest one is written.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()
+        self.running = False
+        # Optional wrapper for each write, such as LinkProfiler.wrap.
+        self.wrap = None
+
+    def write(self, call, *args):
+        """
+        Queue a write, returning straight away.
+        :param call: set_text or set_rgb.
+        :param args: Its arguments.
+        """
+        with self.lock:
+            self.pending.pop(call, None)
+            self.pending[call] = args
+            if self.running:
+                return
+            self.running = True
+        t = threading.Thread(target=self.run)
+        t.daemon = True
+        t.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.running = False
+                    return
+                call, args = self.pending.popitem(last=False)
+            if self.wrap is not None:
+                call = self.wrap(call)
+            try:
+                call(*args)
+            except IOError:
+                pass
+
+
+writer = LcdWriter()
+
+
+def show_text(text):
+    """
+    Set the display's text from the writer thread.
+    :param text: Text to display.
+    """
+    writer.write(set_text, text)
+
+
+def show_rgb(r, g, b):
+    """
+    Set the backlight's RGB colors from the writer thread.
+    """
+    writer.write(set_rgb, r, g, b)
@@ -0,0 +1,173 @@
+import heapq
+import os
+import threading
+from contextlib import contextmanager
+
+import i2c_trace
+from clock import monotonic
+
+# Claim priorities, lower goes first.
+ACTUATOR = 0
+SENSOR = 1
+DISPLAY = 2
+
+
+class I2CBus(object):
+    """
+    Single owner of the I2C bus shared by the GrovePi and the RGB LCD.
+    Every transaction goes through one lock. When several threads are
+    waiting for it, the claim with the highest priority goes first, and
+    claims of equal priority go in arrival order.
+    """
+
+    def __init__(self, device, board_address=0x04):
+        """
+        I2CBus Constructor.
+        :param device: SMBus device, or a trace recorder or replay standing in for one.
+        :param board_address: Address of the GrovePi, the only one whose transactions are counted.
+        """
+        self.device = device
+        self.board_address = board_address
+        self.reset_claims()
+        # Consecutive failed GrovePi transactions and when the last one
+        # succeeded. The LCD and other devices on the bus don't count, an
+        # unplugged one says nothing about the board.
+        self.failures = 0
+        self.last_success = monotonic()
+
+    def reset_claims(self):
+        """
+        Forget every claim and waiter. A process forked from a threaded one
+        calls this first, as the claim or its lock may have been held by a
+        thread that does not exist in the child.
+        """
+        self.condition = threading.Condition()
+        self.owner = None
+        self.depth = 0
+        self.waiting = []
+        self.sequence = 0
+
+    def acquire(self, priority=SENSOR):
+        """
+        Wait for the bus. Reentrant for the thread that already holds it.
+        :param priority: ACTUATOR, SENSOR or DISPLAY.
+        """
+        me = threading.current_thread()
+        with self.condition:
+            if self.owner is me:
+                self.depth += 1
+                return
+            self.sequence += 1
+            entry = (priority, self.sequence)
+            heapq.heappush(self.waiting, entry)
+            while self.owner is not None or self.waiting[0] != entry:
+                self.condition.wait()
+            heapq.heappop(self.waiting)
+            self.owner = me
+            self.depth = 1
+
+    def release(self):
+        """
+        Release the bus, handing it to the next waiting claim.
+        """
+        with self.condition:
+            self.depth -= 1
+            if self.depth == 0:
+                self.owner = None
+                self.condition.notify_all()
+
+    @contextmanager
+    def claim(self, priority=SENSOR):
+        """
+        Hold the bus for a group of transactions that must not be interleaved,
+        such as a GrovePi command and the read of its response.
+        :param priority: ACTUATOR, SENSOR or DISPLAY.
+        """
+        self.acquire(priority)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def transaction(self, call, address, *args):
+        with self.claim():
+            try:
+                result = call(address, *args)
+            except IOError:
+                if address == self.board_address:
+                    self.failures += 1
+                raise
+            if address == self.board_address:
+                self.failures = 0
+                self.last_success = monotonic()
+            return result
+
+    def write_byte_data(self, address, cmd, value):
+        return self.transaction(self.device.write_byte_data, address, cmd, value)
+
+    def write_i2c_block_data(self, address, cmd, values):
+        return self.transaction(self.device.write_i2c_block_data, address, cmd, values)
+
+    def read_byte(self, address):
+        return self.transaction(self.device.read_byte, address)
+
+    def read_i2c_block_data(self, address, cmd):
+        return self.transaction(self.device.read_i2c_block_data, address, cmd)
+
+    def reopen(self):
+        """
+        Close the SMBus device and open it again, to recover a stuck bus.
+        A recording carries on into the same trace, a replay is left alone.
+        If the device cannot be opened, the closed one is kept and the next
+        attempt tries again; its transactions fail as bus errors meanwhile.
+        """
+        with self.claim(ACTUATOR):
+            recorder = self.device if isinstance(self.device, i2c_trace.TraceRecorder) else None
+            device = recorder.device if recorder is not None else self.device
+            if isinstance(device, i2c_trace.ReplayDevice):
+                return
+            try:
+                device.close()
+            except IOError:
+                pass
+            try:
+                opened = open_smbus()
+            except IOError:
+                return
+            if recorder is not None:
+                recorder.device = opened
+            else:
+                self.device = opened
+
+
+def open_device():
+    """
+    Open the I2C device. GROVEPI_I2C_REPLAY=trace replays a recorded trace
+    instead, without needing the Pi libraries, and GROVEPI_I2C_TRACE=trace
+    records every transaction on the real bus.
+    :return: SMBus device.
+    """
+    replay = os.environ.get("GROVEPI_I2C_REPLAY")
+    if replay:
+        return i2c_trace.ReplayDevice(replay, realtime=os.environ.get("GROVEPI_I2C_REPLAY_REALTIME") == "1")
+
+    device = open_smbus()
+    trace = os.environ.get("GROVEPI_I2C_TRACE")
+    if trace:
+        device = i2c_trace.TraceRecorder(device, trace)
+    return device
+
+
+def open_smbus():
+    import smbus
+    import RPi.GPIO as GPIO
+
+    # Use the bus that matches your Raspberry Pi's version
+    rev = GPIO.RPI_REVISION
+    if rev == 2 or rev == 3:
+        return smbus.SMBus(1)
+    else:
+        return smbus.SMBus(0)
+
+
+bus = I2CBus(open_device())
@@ -0,0 +1,195 @@
+"""
+Record and replay of I2C transactions.
+
+A trace is a short header followed by one fixed size record per
+transaction, then the bytes written or read:
+
+    op, address, cmd, status (B), time since start (d), duration (f), length (B)
+
+TraceRecorder wraps a live SMBus device and appends to a trace file.
+ReplayDevice stands in for the SMBus device and answers each transaction
+from a trace, raising IOError where the original transaction failed.
+Run this module on a trace file to print a summary of it.
+"""
+import atexit
+import struct
+import sys
+import time
+
+from clock import monotonic
+
+MAGIC = b"I2CT\x01"
+RECORD = struct.Struct("<BBBBdfB")
+
+WRITE_BYTE_DATA = 1
+WRITE_BLOCK = 2
+READ_BYTE = 3
+READ_BLOCK = 4
+
+OPS = {
+    WRITE_BYTE_DATA: "write_byte_data",
+    WRITE_BLOCK: "write_i2c_block_data",
+    READ_BYTE: "read_byte",
+    READ_BLOCK: "read_i2c_block_data"
+}
+
+
+class TraceMismatch(Exception):
+    """
+    Raised when a replayed session asks for a different transaction than was recorded.
+    """
+    pass
+
+
+class TraceRecorder(object):
+    """
+    Passes transactions through to an SMBus device and records them.
+    """
+
+    def __init__(self, device, path):
+        """
+        TraceRecorder Constructor.
+        :param device: SMBus device to record.
+        :param path: Trace file to write.
+        """
+        self.device = device
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.started = monotonic()
+        atexit.register(self.flush)
+
+    def record(self, op, address, cmd, call, data=None):
+        started = monotonic()
+        status = 0
+        result = None
+        try:
+            result = call()
+            return result
+        except IOError:
+            status = 1
+            raise
+        finally:
+            duration = monotonic() - started
+            if op == READ_BYTE and result is not None:
+                data = [result]
+            elif op == READ_BLOCK and result is not None:
+                data = result
+            payload = bytearray(data or [])
+            self.file.write(RECORD.pack(op, address, cmd, status, started - self.started, duration, len(payload)))
+            self.file.write(payload)
+
+    def write_byte_data(self, address, cmd, value):
+        return self.record(WRITE_BYTE_DATA, address, cmd,
+                           lambda: self.device.write_byte_data(address, cmd, value), [value])
+
+    def write_i2c_block_data(self, address, cmd, values):
+        return self.record(WRITE_BLOCK, address, cmd,
+                           lambda: self.device.write_i2c_block_data(address, cmd, values), values)
+
+    def read_byte(self, address):
+        return self.record(READ_BYTE, address, 0, lambda: self.device.read_byte(address))
+
+    def read_i2c_block_data(self, address, cmd):
+        return self.record(READ_BLOCK, address, cmd, lambda: self.device.read_i2c_block_data(address, cmd))
+
+    def flush(self):
+        if not self.file.closed:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+        close = getattr(self.device, "close", None)
+        if close is not None:
+            close()
+
+
+def read_trace(path):
+    """
+    Load a trace file.
+    :param path: Trace file.
+    :return: List of (op, address, cmd, status, time, duration, data) records.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if not raw.startswith(MAGIC):
+        raise ValueError("%s is not an I2C trace" % path)
+    records = []
+    offset = len(MAGIC)
+    while offset + RECORD.size <= len(raw):
+        op, address, cmd, status, t, duration, length = RECORD.unpack_from(raw, offset)
+        offset += RECORD.size
+        data = list(bytearray(raw[offset:offset + length]))
+        offset += length
+        records.append((op, address, cmd, status, t, duration, data))
+    return records
+
+
+class ReplayDevice(object):
+    """
+    Answers transactions from a recorded trace, in order.
+    """
+
+    def __init__(self, path, realtime=False, strict=True):
+        """
+        ReplayDevice Constructor.
+        :param path: Trace file to replay.
+        :param realtime: Sleep for each recorded duration, to reproduce slow responses.
+        :param strict: Raise TraceMismatch when a transaction differs from the trace.
+        """
+        self.records = read_trace(path)
+        self.position = 0
+        self.realtime = realtime
+        self.strict = strict
+
+    def next(self, op, address, cmd, data=None):
+        if self.position >= len(self.records):
+            raise TraceMismatch("Trace exhausted after %d transactions" % self.position)
+        record = self.records[self.position]
+        self.position += 1
+        if self.strict:
+            expected = (record[0], record[1], record[2])
+            if (op, address, cmd) != expected or (data is not None and list(data) != record[6]):
+                raise TraceMismatch("Transaction %d: expected %s(0x%02x, %d), got %s(0x%02x, %d)" % (
+                    self.position - 1, OPS[expected[0]], expected[1], expected[2], OPS[op], address, cmd))
+        if self.realtime:
+            time.sleep(record[5])
+        if record[3]:
+            raise IOError("Recorded I2C failure")
+        return record[6]
+
+    def write_byte_data(self, address, cmd, value):
+        self.next(WRITE_BYTE_DATA, address, cmd, [value])
+
+    def write_i2c_block_data(self, address, cmd, values):
+        self.next(WRITE_BLOCK, address, cmd, values)
+
+    def read_byte(self, address):
+        return self.next(READ_BYTE, address, 0)[0]
+
+    def read_i2c_block_data(self, address, cmd):
+        return self.next(READ_BLOCK, address, cmd)
+
+    def close(self):
+        pass
+
+
+def summary(path):
+    """
+    Print transaction counts, failures and timing per address and operation.
+    :param path: Trace file.
+    """
+    stats = {}
+    records = read_trace(path)
+    for op, address, cmd, status, t, duration, data in records:
+        count, failures, total, worst = stats.get((address, op), (0, 0, 0.0, 0.0))
+        stats[(address, op)] = (count + 1, failures + status, total + duration, max(worst, duration))
+    print("%d transactions over %.3f s" % (len(records), records[-1][4] if records else 0))
+    print("%-8s %-22s %8s %8s %10s %10s" % ("address", "op", "count", "failed", "mean ms", "max ms"))
+    for address, op in sorted(stats):
+        count, failures, total, worst = stats[(address, op)]
+        print("0x%02x     %-22s %8d %8d %10.3f %10.3f" % (
+            address, OPS[op], count, failures, total * 1000 / count, worst * 1000))
+
+
+if __name__ == "__main__":
+    summary(sys.argv[1])
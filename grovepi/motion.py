@@ -0,0 +1,51 @@
+import math
+import threading
+
+# Counts per g of the MMA7660 on the Grove accelerometer (+/- 1.5g in 6 bits).
+COUNTS_PER_G = 21.33
+
+
+def to_g(counts):
+    return round(counts / COUNTS_PER_G, 3)
+
+
+class MotionSummary(object):
+    """
+    Summary of the accelerometer frames a high rate worker reads between two
+    acquisition cycles. Motion is the RMS of how far each frame's magnitude
+    is from 1 g, so it reads 0 at rest whichever way up the sensor is, and
+    peak is the largest magnitude seen.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.square_sum = 0.0
+        self.peak = 0.0
+
+    def add(self, x, y, z):
+        """
+        Add a frame, called from the worker thread.
+        :param x: X acceleration in g.
+        :param y: Y acceleration in g.
+        :param z: Z acceleration in g.
+        """
+        magnitude = math.sqrt(x * x + y * y + z * z)
+        with self.lock:
+            self.frames += 1
+            self.square_sum += (magnitude - 1) ** 2
+            self.peak = max(self.peak, magnitude)
+
+    def take(self):
+        """
+        Take the summary of the frames added since the last call and start a new one.
+        :return: (Motion, peak) in g, or None if no frames were added.
+        """
+        with self.lock:
+            if not self.frames:
+                return None
+            summary = (round(math.sqrt(self.square_sum / self.frames), 3), round(self.peak, 3))
+            self.frames = 0
+            self.square_sum = 0.0
+            self.peak = 0.0
+        return summary
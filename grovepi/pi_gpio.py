@@ -0,0 +1,79 @@
+import time
+from datetime import datetime
+
+from twisted.internet import reactor
+
+# BCM pin wired to the GrovePi reset line.
+RESET_PIN = 8
+
+
+def reset_board(gpio, pin=RESET_PIN, pulse=0.1):
+    """
+    Reset the GrovePi by pulling its reset line low, then let it go.
+    :param gpio: RPi.GPIO, or a module standing in for it, with the pin numbering set.
+    :param pin: BCM pin of the reset line.
+    :param pulse: Seconds to hold reset.
+    """
+    gpio.setup(pin, gpio.OUT)
+    gpio.output(pin, gpio.LOW)
+    time.sleep(pulse)
+    gpio.output(pin, gpio.HIGH)
+    gpio.setup(pin, gpio.IN)
+
+
+class EdgeInputs(object):
+    """
+    Digital inputs wired straight to the Raspberry Pi header. Instead of
+    being polled over I2C they report each edge from the RPi.GPIO event
+    thread, which is handed to the reactor along with the pin level and the
+    time of the edge.
+    """
+
+    def __init__(self, gpio=None, bouncetime=10):
+        """
+        EdgeInputs Constructor.
+        :param gpio: RPi.GPIO, or a module standing in for it. Imported when first needed if None.
+        :param bouncetime: Milliseconds RPi.GPIO ignores further edges for.
+        """
+        self.gpio = gpio
+        self.bouncetime = bouncetime
+        self.pins = set()
+
+    def get_gpio(self):
+        if self.gpio is None:
+            import RPi.GPIO as GPIO
+            self.gpio = GPIO
+        if self.gpio.getmode() is None:
+            self.gpio.setmode(self.gpio.BCM)
+        return self.gpio
+
+    def add(self, pin, callback):
+        """
+        Start reporting edges on a pin.
+        :param pin: BCM pin number.
+        :param callback: Called on the reactor with the pin level and the datetime of the edge.
+        :return: Current pin level.
+        """
+        gpio = self.get_gpio()
+        if pin in self.pins:
+            gpio.remove_event_detect(pin)
+        gpio.setup(pin, gpio.IN)
+
+        def edge(channel):
+            reactor.callFromThread(callback, bool(gpio.input(channel)), datetime.now())
+
+        gpio.add_event_detect(pin, gpio.BOTH, callback=edge, bouncetime=self.bouncetime)
+        self.pins.add(pin)
+        return bool(gpio.input(pin))
+
+    def remove(self, pin):
+        """
+        Stop reporting edges on a pin and release it.
+        :param pin: BCM pin number.
+        """
+        if pin not in self.pins:
+            return
+        gpio = self.get_gpio()
+        gpio.remove_event_detect(pin)
+        gpio.cleanup(pin)
+        self.pins.discard(pin)
@@ -0,0 +1,80 @@
+import cProfile
+import pstats
+import threading
+
+
+class LinkProfiler(object):
+    """
+    Profiles the reactor thread, and any worker thread jobs passed through
+    wrap(), for a limited time while the link keeps running.
+    """
+
+    def __init__(self):
+        """
+        LinkProfiler Constructor.
+        """
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.active = False
+        self.stats = None
+
+    def start(self):
+        """
+        Start profiling the calling thread, which should be the reactor.
+        """
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles = [profile]
+            self.active = True
+        profile.enable()
+
+    def stop(self, dump_path=None):
+        """
+        Stop profiling and merge the reactor and worker profiles.
+        :param dump_path: Optionally write the merged stats here for offline analysis.
+        """
+        with self.lock:
+            self.active = False
+            profiles = self.profiles
+            self.profiles = []
+        profiles[0].disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        self.stats = stats
+        if dump_path:
+            stats.dump_stats(dump_path)
+
+    def wrap(self, call):
+        """
+        Wrap a job for a worker thread so it is profiled while a run is active.
+        :param call: Function to wrap.
+        :return: Wrapped function.
+        """
+        def profiled(*args, **kwargs):
+            if not self.active:
+                return call(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(call, *args, **kwargs)
+            finally:
+                # Jobs that outlive the run are dropped rather than merged half way.
+                with self.lock:
+                    if self.active:
+                        self.profiles.append(profile)
+        return profiled
+
+    def top(self, count=20, sort="cumulative"):
+        """
+        Top functions of the last finished run.
+        :param count: Number of rows.
+        :param sort: "cumulative" or "self".
+        :return: Rows of function, calls, self seconds and cumulative seconds.
+        """
+        if self.stats is None:
+            return []
+        rows = []
+        for (filename, line, name), (cc, nc, tt, ct, callers) in self.stats.stats.items():
+            rows.append(["%s:%d(%s)" % (filename, line, name), nc, round(tt, 6), round(ct, 6)])
+        rows.sort(key=lambda row: row[2] if sort == "self" else row[3], reverse=True)
+        return rows[:count]
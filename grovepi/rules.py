@@ -0,0 +1,87 @@
+CONDITIONS = ["Above", "Below", "Is True", "Is False"]
+
+
+def parse_output_value(value_type, text):
+    """
+    Convert a configured output value to what the output Node takes.
+    :param value_type: Type of the output Node.
+    :param text: Configured value, empty to leave the output alone.
+    :return: Value, or None.
+    """
+    text = str(text).strip()
+    if text == "":
+        return None
+    if value_type == "bool":
+        if text.lower() in ["true", "on", "1"]:
+            return True
+        if text.lower() in ["false", "off", "0"]:
+            return False
+        raise ValueError("Expected true or false")
+    return int(float(text))
+
+
+class Rule(object):
+    """
+    Condition on one input value that drives an output, evaluated by the
+    link right after each sample. Above and Below only switch back once
+    the value has crossed the threshold by the hysteresis, and a change of
+    state has to hold for the debounce time before the rule switches.
+    """
+
+    def __init__(self, node, input_path, condition, threshold, hysteresis, debounce,
+                 output_path, on_value, off_value):
+        """
+        Rule Constructor.
+        :param node: Rule Node, its value shows whether the rule is active.
+        :param input_path: Path of the Node the condition is on.
+        :param condition: One of CONDITIONS.
+        :param threshold: Threshold for Above and Below.
+        :param hysteresis: Distance back across the threshold before the rule switches off.
+        :param debounce: Seconds a change has to hold before the rule switches.
+        :param output_path: Path of the output module Node.
+        :param on_value: Value written when the rule switches on, or None.
+        :param off_value: Value written when the rule switches off, or None.
+        """
+        self.node = node
+        self.input_path = input_path
+        self.condition = condition
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.debounce = debounce
+        self.output_path = output_path
+        self.on_value = on_value
+        self.off_value = off_value
+        self.active = False
+        self.pending_since = None
+
+    def test(self, value):
+        if self.condition == "Is True":
+            return bool(value)
+        elif self.condition == "Is False":
+            return not value
+        elif self.condition == "Above":
+            return value > (self.threshold - self.hysteresis if self.active else self.threshold)
+        elif self.condition == "Below":
+            return value < (self.threshold + self.hysteresis if self.active else self.threshold)
+        raise ValueError("Unknown condition %s" % self.condition)
+
+    def update(self, value, now):
+        """
+        Feed a new input value to the rule.
+        :param value: Input value.
+        :param now: Monotonic time of the sample.
+        :return: True if the rule switched on or off.
+        """
+        if value is None or self.test(value) == self.active:
+            self.pending_since = None
+            return False
+        if self.pending_since is None:
+            self.pending_since = now
+        if now - self.pending_since < self.debounce:
+            return False
+        self.active = not self.active
+        self.pending_since = None
+        return True
+
+    def output_value(self):
+        return self.on_value if self.active else self.off_value
@@ -0,0 +1,25 @@
+from dslink.DSLink import SubscriptionManager
+
+
+class LinkSubscriptionManager(SubscriptionManager):
+    """
+    Hands each new subscription to the link to decide what the subscriber
+    is sent first. The SDK would send the cached value, however old, to
+    every subscriber of the Node.
+    """
+
+    def __init__(self, link, subscriptions=None):
+        """
+        LinkSubscriptionManager Constructor.
+        :param link: GrovePiDSLink.
+        :param subscriptions: Subscriptions to carry over from the SDK's manager.
+        """
+        SubscriptionManager.__init__(self)
+        self.link = link
+        if subscriptions:
+            self.subscriptions.update(subscriptions)
+
+    def subscribe(self, node, sid):
+        self.subscriptions[sid] = node
+        node.subscribers.append(sid)
+        self.link.subscribed(node, sid)
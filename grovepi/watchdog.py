@@ -0,0 +1,59 @@
+class BoardWatchdog(object):
+    """
+    Notices when every GrovePi transaction has been failing for a while, as
+    when the GrovePi firmware hangs or the bus gets stuck, and works to get
+    the board answering again. Each attempt probes the board, reopens the
+    bus and probes again, then resets the board and gives it time to boot,
+    backing off between attempts that fail.
+    """
+
+    def __init__(self, bus, probe, reset, recovered, fail_count=10, fail_time=5.0, boot_time=2.0, max_backoff=60.0):
+        """
+        BoardWatchdog Constructor.
+        :param bus: I2CBus to watch.
+        :param probe: Returns True if the board answers.
+        :param reset: Resets the board.
+        :param recovered: Called with the seconds the board was out once it answers again.
+        :param fail_count: Consecutive failed transactions that count as a failed board.
+        :param fail_time: Seconds without a good transaction that count as a failed board.
+        :param boot_time: Seconds to give the board after a reset.
+        :param max_backoff: Longest wait between attempts.
+        """
+        self.bus = bus
+        self.probe = probe
+        self.reset = reset
+        self.recovered = recovered
+        self.fail_count = fail_count
+        self.fail_time = fail_time
+        self.boot_time = boot_time
+        self.max_backoff = max_backoff
+        self.failed_since = None
+        self.attempts = 0
+
+    def check(self, now):
+        """
+        Run once per acquisition cycle, before polling.
+        :param now: Monotonic time.
+        :return: Monotonic time to hold polling off until, or None to poll.
+        """
+        if self.failed_since is None:
+            if self.bus.failures < self.fail_count or now - self.bus.last_success < self.fail_time:
+                return None
+            self.failed_since = self.bus.last_success
+            self.attempts = 0
+
+        if self.probe():
+            return self.finish(now)
+        self.bus.reopen()
+        if self.probe():
+            return self.finish(now)
+        self.reset()
+        self.attempts += 1
+        return now + min(self.max_backoff, self.boot_time * 2 ** (self.attempts - 1))
+
+    def finish(self, now):
+        duration = now - self.failed_since
+        self.failed_since = None
+        self.attempts = 0
+        self.recovered(duration)
+        return None
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Compare writing the RGB LCD one character per transaction with the block
+transfers used by grove_rgb_led. Run on a Pi with the LCD attached:
+
+    python tool/lcd_benchmark.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "grovepi"))
+
+import grove_rgb_led
+from i2c_bus import bus, DISPLAY
+
+
+class CountingDevice(object):
+    """
+    Wraps the SMBus device and counts transactions.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.transactions = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.device, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args):
+            self.transactions += 1
+            return attr(*args)
+        return counted
+
+
+def per_character(text):
+    # How grove_rgb_led wrote text before block transfers.
+    for row in range(2):
+        with bus.claim(DISPLAY):
+            grove_rgb_led.text_command(0x80 if row == 0 else 0xc0)
+            for c in text[row * 16:(row + 1) * 16]:
+                bus.write_byte_data(grove_rgb_led.DISPLAY_TEXT_ADDR, 0x40, ord(c))
+
+
+def block(text):
+    for row in range(2):
+        grove_rgb_led.write_row(row, text[row * 16:(row + 1) * 16])
+
+
+def run(name, write, iterations):
+    text = "0123456789abcdefGHIJKLMNOPQRSTUV"
+    device = CountingDevice(bus.device)
+    bus.device = device
+    try:
+        started = time.time()
+        for i in range(iterations):
+            write(text)
+        elapsed = time.time() - started
+    finally:
+        bus.device = device.device
+    print("%-14s %6d transactions/screen %9.3f ms/screen" % (
+        name, device.transactions // iterations, elapsed * 1000 / iterations))
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    run("per character", per_character, iterations)
+    run("block", block, iterations)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+"""
+Soak test for GrovePiDSLink. Runs the link against a simulated bus on an
+accelerated clock, with no broker, while modules are added and removed
+and subscriptions come and go at random. Memory, object counts, poll cycle
+time and publish counts are reported as it goes, and the run fails if
+any of them grows past its bound over the run after warm up. No Pi is
+needed:
+
+    python tool/soak.py [--hours 24] [--seed 1]
+"""
+import argparse
+import gc
+import os
+import random
+import resource
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "grovepi"))
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class SimulatedDevice(object):
+    """
+    Stands in for the SMBus device, answering every read with plausible
+    GrovePi responses.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.transactions = 0
+
+    def write_byte_data(self, address, cmd, value):
+        self.transactions += 1
+
+    def write_i2c_block_data(self, address, cmd, values):
+        self.transactions += 1
+
+    def read_byte(self, address):
+        self.transactions += 1
+        return self.rng.randint(0, 1)
+
+    def read_i2c_block_data(self, address, cmd):
+        self.transactions += 1
+        return [cmd] + [self.rng.randint(0, 3) for i in range(31)]
+
+
+def install_simulated_bus(device):
+    # i2c_bus opens the device when it is first imported.
+    smbus = types.ModuleType("smbus")
+    smbus.SMBus = lambda number: device
+    rpi = types.ModuleType("RPi")
+    gpio = types.ModuleType("RPi.GPIO")
+    gpio.RPI_REVISION = 3
+    rpi.GPIO = gpio
+    sys.modules["smbus"] = smbus
+    sys.modules["RPi"] = rpi
+    sys.modules["RPi.GPIO"] = gpio
+
+
+def make_clock():
+    from twisted.internet import task
+
+    class SimulatedReactor(task.Clock):
+        """
+        Clock for the link's callLater, running thread jobs in place.
+        """
+
+        def callInThread(self, f, *args, **kwargs):
+            f(*args, **kwargs)
+
+        def callFromThread(self, f, *args, **kwargs):
+            f(*args, **kwargs)
+
+    return SimulatedReactor()
+
+
+class CountingWsp(object):
+    """
+    Stands in for the broker connection, counting what would be sent.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.updates = 0
+
+    def sendMessage(self, message):
+        self.messages += 1
+        for response in message.get("responses", []):
+            self.updates += len(response.get("updates", []))
+
+
+MODULES = [
+    ("Light Sensor", "A0"),
+    ("Rotary Angle Sensor", "A1"),
+    ("Sound Sensor", "A2"),
+    ("Button", "D4"),
+    ("LED", "D3"),
+    ("Relay", "D7"),
+    ("Buzzer", "D6"),
+    ("Temp and Humid", "D8"),
+    ("Ultrasonic Ranger", "D5"),
+    ("Encoder", "D2"),
+    ("Accelerometer", "I2C-1"),
+    ("RTC", "I2C-2")
+]
+
+
+class Soak(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.device = SimulatedDevice(self.rng)
+        install_simulated_bus(self.device)
+
+        import dsa_grovepi
+        import GrovePiDSLink as link_module
+        from dslink import DSLink
+        from dslink.DSLink import SubscriptionManager
+        from dslink.Profile import ProfileManager
+
+        self.clock = make_clock()
+        # Everything the link schedules, and the time it reads, comes from the clock.
+        link_module.reactor = self.clock
+        link_module.monotonic = self.clock.seconds
+        dsa_grovepi.time = types.ModuleType("time")
+        dsa_grovepi.time.sleep = lambda seconds: None
+
+        self.wsp = CountingWsp()
+        wsp = self.wsp
+
+        def attach(link, config):
+            # Replaces DSLink.__init__, which would connect to a broker and run the reactor.
+            link.config = config
+            link.active = True
+            link.nodes_changed = False
+            link.logger = DSLink.create_logger("Soak")
+            link.super_root = link.get_default_nodes()
+            link.create_defs()
+            link.subman = SubscriptionManager()
+            link.profile_manager = ProfileManager(link)
+            link.wsp = wsp
+
+        connect = DSLink.__init__
+        DSLink.__init__ = attach
+        try:
+            self.link = link_module.GrovePiDSLink(None)
+        finally:
+            DSLink.__init__ = connect
+        self.link.start()
+        self.link.super_root.get("/poll_speed").set_value(args.poll_speed)
+
+        self.publishes = 0
+        self.ticks = 0
+        self.cycle_time = 0.0
+        self.instrument()
+        self.next_name = 0
+        self.next_sid = 0
+        self.sids = {}
+        self.reports = []
+
+    def instrument(self):
+        link = self.link
+        publish = link.publish
+        update_values = link.update_values
+
+        def counted_publish(node, value, ts=None):
+            self.publishes += 1
+            publish(node, value, ts)
+
+        def timed_update_values():
+            started = time.time()
+            update_values()
+            self.cycle_time += time.time() - started
+            self.ticks += 1
+
+        link.publish = counted_publish
+        link.update_values = timed_update_values
+
+    def modules(self):
+        return [node for node in self.link.super_root.children.values() if "@module" in node.attributes]
+
+    def value_nodes(self):
+        nodes = []
+        for module in self.modules():
+            for node in [module] + list(module.children.values()):
+                if "$type" in node.config and "$invokable" not in node.config and not node.transient:
+                    nodes.append(node)
+        return nodes
+
+    def churn(self):
+        action = self.rng.random()
+        modules = self.modules()
+        if action < 0.2 and len(modules) < len(MODULES):
+            used = set(node.attributes["@address"] for node in modules)
+            module_type, address = self.rng.choice([m for m in MODULES if m[1] not in used])
+            self.next_name += 1
+            self.link.super_root.get("/add_module").invoke({
+                "Name": "m%d" % self.next_name,
+                "Type": module_type,
+                "Address": address
+            })
+        elif action < 0.35 and modules:
+            module = self.rng.choice(modules)
+            # The broker drops subscriptions to nodes that go away.
+            for sid, node in list(self.sids.items()):
+                if node.path.startswith(module.path + "/") or node.path == module.path:
+                    self.unsubscribe(sid)
+            module.get("/remove_module").invoke({})
+        elif action < 0.7:
+            nodes = self.value_nodes()
+            if nodes:
+                self.next_sid += 1
+                node = self.rng.choice(nodes)
+                self.sids[self.next_sid] = node
+                self.link.subman.subscribe(node, self.next_sid)
+        elif self.sids:
+            self.unsubscribe(self.rng.choice(list(self.sids)))
+
+    def unsubscribe(self, sid):
+        self.link.subman.unsubscribe(sid)
+        del self.sids[sid]
+
+    def report(self, hours):
+        gc.collect()
+        report = {
+            "hours": hours,
+            "rss": rss_mb(),
+            "objects": len(gc.get_objects()),
+            "traced": tracemalloc.get_traced_memory()[0] / 1048576.0 if tracemalloc else 0.0,
+            "cycle_ms": self.cycle_time * 1000 / max(1, self.ticks),
+            "modules": len(self.modules()),
+            "subscriptions": len(self.sids),
+            "publish_ratio": float(self.publishes) / max(1, self.ticks),
+            "updates": self.wsp.updates
+        }
+        self.reports.append(report)
+        self.publishes = 0
+        self.ticks = 0
+        self.cycle_time = 0.0
+        print("%7.2f h  rss %7.2f MB  traced %7.2f MB  objects %8d  cycle %7.3f ms  "
+              "modules %2d  subs %3d  publishes/tick %6.2f" % (
+                  hours, report["rss"], report["traced"], report["objects"], report["cycle_ms"],
+                  report["modules"], report["subscriptions"], report["publish_ratio"]))
+
+    def run(self):
+        if tracemalloc:
+            tracemalloc.start()
+        step = self.args.poll_speed
+        churn_every = int(self.args.churn / step)
+        report_every = int(self.args.report * 3600 / step)
+        steps = int(self.args.hours * 3600 / step)
+        for i in range(1, steps + 1):
+            self.clock.advance(step)
+            if i % churn_every == 0:
+                self.churn()
+            if i % report_every == 0:
+                self.report(i * step / 3600.0)
+        return self.check()
+
+    def check(self):
+        """
+        Compare the last report with the first one after warm up. Cycle time
+        and publishes follow whatever the churn has added and subscribed at
+        the time, so their means over the two halves of the run are compared.
+        :return: List of bounds that were exceeded.
+        """
+        reports = [r for r in self.reports if r["hours"] >= self.args.warmup]
+        if len(reports) < 2:
+            return ["Not enough reports after warm up"]
+        first, last = reports[0], reports[-1]
+        half = len(reports) // 2
+        failures = []
+        if last["rss"] - first["rss"] > self.args.max_rss_growth:
+            failures.append("RSS grew %.2f MB" % (last["rss"] - first["rss"]))
+        if last["traced"] - first["traced"] > self.args.max_rss_growth:
+            failures.append("Traced allocations grew %.2f MB" % (last["traced"] - first["traced"]))
+        if last["objects"] - first["objects"] > self.args.max_object_growth:
+            failures.append("Object count grew by %d" % (last["objects"] - first["objects"]))
+        for key, name in [("cycle_ms", "Cycle time"), ("publish_ratio", "Publishes per tick")]:
+            before = sum(r[key] for r in reports[:half]) / half
+            after = sum(r[key] for r in reports[half:]) / (len(reports) - half)
+            if before > 0 and after / before > self.args.max_ratio_growth:
+                failures.append("%s grew %.2fx" % (name, after / before))
+        return failures
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1048576.0
+    except IOError:
+        # Peak rather than current, but still catches growth.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak GrovePiDSLink against a simulated bus.")
+    parser.add_argument("--hours", type=float, default=24, help="Simulated hours to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--poll-speed", type=float, default=0.1, help="Poll Speed in seconds")
+    parser.add_argument("--churn", type=float, default=5, help="Simulated seconds between churn actions")
+    parser.add_argument("--report", type=float, default=0.5, help="Simulated hours between reports")
+    parser.add_argument("--warmup", type=float, default=1, help="Simulated hours before the baseline report")
+    parser.add_argument("--max-rss-growth", type=float, default=5, help="MB")
+    parser.add_argument("--max-object-growth", type=int, default=5000)
+    parser.add_argument("--max-ratio-growth", type=float, default=1.5,
+                        help="Allowed growth of mean cycle time and publishes per tick")
+    args = parser.parse_args()
+
+    failures = Soak(args).run()
+    for failure in failures:
+        print("FAIL: %s" % failure)
+    sys.exit(1 if failures else 0)